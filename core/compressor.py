@@ -1,10 +1,13 @@
 # core/compressor.py
+import base64
+import binascii
 import io
 import re
-from PIL import Image
-import htmlmin
-import cssmin
-import jsmin
+
+from . import probe
+
+# Pillow and the minifiers are imported inside the functions that use them,
+# so a run only pays for the engines its enabled stages need.
 
 # --- Image Compression ---
 
@@ -15,7 +18,7 @@ def compress_image(image_bytes, options):
     Converts to a more efficient format and reduces quality/resolution.
 
     Args:
-        image_bytes (bytes): The raw bytes of the image.
+        image_bytes (bytes): The raw bytes of the image (any bytes-like object).
         options (dict): A dictionary with compression settings.
                         - 'quality' (int): 0-100 quality for JPEG/WEBP.
                         - 'max_width' (int): Maximum width to resize to.
@@ -25,6 +28,8 @@ def compress_image(image_bytes, options):
         bytes: The compressed image bytes.
         str: The new file extension (e.g., '.jpeg').
     """
+    from PIL import Image
+
     try:
         img = Image.open(io.BytesIO(image_bytes))
         original_format = img.format.upper()
@@ -69,6 +74,63 @@ def compress_image(image_bytes, options):
         return image_bytes, None
 
 
+# --- Inline Images ---
+
+# Raster images embedded as base64 data: URIs in XHTML attributes and CSS.
+DATA_URI_PATTERN = re.compile(
+    r"data:image/(?:png|jpe?g|gif|webp);base64,[A-Za-z0-9+/]+=*", re.I
+)
+
+
+def compress_data_uri(uri, options):
+    """
+    Recompresses the raster image inside a base64 data: URI.
+
+    Args:
+        uri (str): A complete data:image/...;base64,... URI.
+        options (dict): The same image options passed to compress_image().
+                        - 'skip_optimized' (bool): Probe headers first and
+                          leave already-optimized images alone.
+
+    Returns:
+        str: A smaller data: URI, or the original if nothing was gained.
+    """
+    try:
+        image_bytes = base64.b64decode(uri.partition(",")[2], validate=True)
+    except (binascii.Error, ValueError) as e:
+        print(f"Could not decode inline image: {e}")
+        return uri
+
+    if options.get("skip_optimized", True) and probe.should_skip_image(
+        probe.probe_image(image_bytes), options
+    ):
+        return uri
+
+    compressed_bytes, new_ext = compress_image(image_bytes, options)
+    if not new_ext or len(compressed_bytes) >= len(image_bytes):
+        return uri
+
+    # The media type travels with the data, so a format change needs no rename.
+    encoded = base64.b64encode(compressed_bytes).decode("ascii")
+    return f"data:image/{new_ext[1:]};base64,{encoded}"
+
+
+def compress_data_uris(text, options):
+    """
+    Recompresses every inline raster image in a piece of XHTML or CSS text.
+
+    Args:
+        text (str): The text containing data: URIs.
+        options (dict): The same image options passed to compress_data_uri().
+
+    Returns:
+        str: The text with each image replaced by its compressed version.
+    """
+    return DATA_URI_PATTERN.sub(
+        lambda match: compress_data_uri(match.group(0), options), text
+    )
+
+
 # --- Text Minification ---
 
 
@@ -77,26 +139,34 @@ def minify_content(content_bytes, file_type):
     Minifies HTML, CSS, or JS content.
 
     Args:
-        content_bytes (bytes): Raw bytes of the text file.
+        content_bytes (bytes): Raw bytes of the text file (any bytes-like object).
         file_type (str): 'html', 'css', or 'js'.
 
     Returns:
         bytes: Minified content bytes.
     """
+    if file_type not in ("html", "css", "js"):
+        return content_bytes
+
     try:
-        content_str = content_bytes.decode("utf-8")
+        # str() decodes straight from the buffer, so memoryviews are not copied first.
+        content_str = str(content_bytes, "utf-8")
         minified_str = ""
 
         if file_type == "html":
+            import htmlmin
+
             minified_str = htmlmin.minify(
                 content_str, remove_comments=True, remove_empty_space=True
             )
         elif file_type == "css":
+            import cssmin
+
             minified_str = cssmin.cssmin(content_str)
         elif file_type == "js":
+            import jsmin
+
             minified_str = jsmin.jsmin(content_str)
-        else:
-            return content_bytes
 
         return minified_str.encode("utf-8")
     except Exception as e:
@@ -107,24 +177,32 @@ def minify_content(content_bytes, file_type):
 # --- Font Handling ---
 
 
+# A robust regex to find @font-face blocks, even with nested braces in comments.
+# It works on the raw bytes, so CSS never needs decoding just to drop fonts.
+FONT_FACE_PATTERN = re.compile(
+    rb"@font-face\s*\{[^{}]*(((?<=\()data:[^;]+)|[^{}]|\{[^{}]*\})*\}"
+)
+
+
 def strip_font_rules_from_css(css_content_bytes):
     """
     Removes all @font-face rules from a CSS file.
 
     Args:
-        css_content_bytes (bytes): The raw bytes of the CSS file.
+        css_content_bytes (bytes): The raw bytes of the CSS file (any
+                                   bytes-like object).
 
     Returns:
-        bytes: The CSS content with @font-face rules removed.
+        bytes: The CSS content with @font-face rules removed, or the input
+               object itself if it has none.
     """
+    # A regex search rather than `in`: a bytes needle is never found "in" a
+    # memoryview, which would skip stripping silently.
+    if not FONT_FACE_PATTERN.search(css_content_bytes):
+        return css_content_bytes
+
     try:
-        css_content = css_content_bytes.decode("utf-8")
-        # A robust regex to find @font-face blocks, even with nested braces in comments.
-        font_face_pattern = re.compile(
-            r"@font-face\s*\{[^{}]*(((?<=\()data:[^;]+)|[^{}]|\{[^{}]*\})*\}"
-        )
-        cleaned_css = font_face_pattern.sub("", css_content)
-        return cleaned_css.encode("utf-8")
+        return FONT_FACE_PATTERN.sub(b"", css_content_bytes)
     except Exception as e:
         print(f"Could not strip fonts from CSS: {e}")
         return css_content_bytes
@@ -0,0 +1,155 @@
+# core/dedupe.py
+import hashlib
+import io
+import re
+
+from . import document
+
+# Binary assets that can be merged safely. Stylesheets and SVG are left out:
+# identical bytes in different folders can resolve relative links differently.
+DEDUPE_MEDIA_TYPES = {
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+    "font/ttf",
+    "font/otf",
+    "font/woff",
+    "font/woff2",
+    "application/font-sfnt",
+    "application/font-woff",
+    "application/x-font-ttf",
+    "application/x-font-otf",
+    "application/x-font-truetype",
+    "application/x-font-opentype",
+    "application/vnd.ms-opentype",
+}
+
+RASTER_MEDIA_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+# Decoded images are treated as re-encodes of the same picture when almost
+# no pixel differs by more than PIXEL_TOLERANCE (0-255, largest channel).
+# Lossy re-encodes stay under it nearly everywhere, while a real change, even
+# one changed digit in a caption, pushes a block of pixels far over it. A mean
+# would average such a change away.
+PIXEL_TOLERANCE = 48
+PIXEL_OUTLIER_SHARE = 0.0001
+FINGERPRINT_SIZE = (8, 8)
+
+_CSS_URL_PATTERN = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+
+
+def find_duplicates(entries, keep=(), compare_pixels=False):
+    """
+    Groups byte-identical assets, and optionally pixel-identical images,
+    and picks one file from each group to keep.
+
+    Args:
+        entries (list): (file_name, media_type, content) tuples in manifest order.
+        keep (iterable): File names that must survive, such as the cover.
+        compare_pixels (bool): Also merge raster images whose decoded pixels
+                               match (see PIXEL_TOLERANCE). This decodes
+                               every image, so it is off by default.
+
+    Returns:
+        dict: Maps each duplicate file name to the file name replacing it.
+    """
+    keep = set(keep)
+    groups = {}
+    for file_name, media_type, content in entries:
+        if media_type in DEDUPE_MEDIA_TYPES:
+            digest = hashlib.sha1(content).digest()
+            groups.setdefault(digest, []).append((file_name, media_type, content))
+
+    if compare_pixels:
+        groups = _merge_pixel_duplicates(list(groups.values()))
+    else:
+        groups = list(groups.values())
+
+    redirects = {}
+    for group in groups:
+        if len(group) < 2:
+            continue
+        # Prefer a protected file, then the largest (best quality) copy.
+        canonical = max(group, key=lambda entry: (entry[0] in keep, len(entry[2])))[0]
+        for file_name, _, _ in group:
+            if file_name != canonical and file_name not in keep:
+                redirects[file_name] = canonical
+    return redirects
+
+
+def _fingerprint(content):
+    """Returns (size, tiny thumbnail) for bucketing, or None if undecodable."""
+    from PIL import Image
+
+    try:
+        img = Image.open(io.BytesIO(content))
+        size = img.size
+        thumb = img.convert("RGB").resize(FINGERPRINT_SIZE, Image.Resampling.BOX)
+        return size, bytes(value >> 4 for value in thumb.tobytes())
+    except Exception as e:
+        print(f"Could not fingerprint image: {e}")
+        return None
+
+
+def _pixels_match(content_a, content_b):
+    from PIL import Image, ImageChops
+
+    try:
+        img_a = Image.open(io.BytesIO(content_a)).convert("RGB")
+        img_b = Image.open(io.BytesIO(content_b)).convert("RGB")
+        if img_a.size != img_b.size:
+            return False
+        red, green, blue = ImageChops.difference(img_a, img_b).split()
+        worst = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+        outliers = sum(worst.histogram()[PIXEL_TOLERANCE + 1 :])
+        return outliers <= img_a.width * img_a.height * PIXEL_OUTLIER_SHARE
+    except Exception as e:
+        print(f"Could not compare images: {e}")
+        return False
+
+
+def _merge_pixel_duplicates(groups):
+    """Joins exact-duplicate groups whose images decode to the same picture."""
+    buckets = {}
+    merged = []
+    for group in groups:
+        file_name, media_type, content = group[0]
+        fingerprint = (
+            _fingerprint(content) if media_type in RASTER_MEDIA_TYPES else None
+        )
+        if fingerprint is None:
+            merged.append(group)
+            continue
+
+        for candidate in buckets.setdefault(fingerprint, []):
+            if _pixels_match(candidate[0][2], content):
+                candidate.extend(group)
+                break
+        else:
+            buckets[fingerprint].append(group)
+            merged.append(group)
+    return merged
+
+
+def rewrite_css_references(css_text, file_name, redirects):
+    """
+    Repoints url(...) links in a stylesheet at merged duplicates.
+
+    Args:
+        css_text (str): The stylesheet.
+        file_name (str): The stylesheet's own file name in the manifest.
+        redirects (dict): The result of find_duplicates().
+
+    Returns:
+        str: The stylesheet with its links updated.
+    """
+
+    def replace(match):
+        quote_char, reference = match.group(1), match.group(2)
+        new_reference = document.redirect_reference(file_name, reference, redirects)
+        if new_reference == reference:
+            return match.group(0)
+        return f"url({quote_char}{new_reference}{quote_char})"
+
+    return _CSS_URL_PATTERN.sub(replace, css_text)
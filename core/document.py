@@ -0,0 +1,377 @@
+# core/document.py
+import posixpath
+import re
+from urllib.parse import quote, unquote, urlsplit
+
+from . import compressor
+
+# --- Event Stream ---
+#
+# A document is parsed once into a flat stream of events, every registered
+# transform runs over that stream in turn, and the result is serialized once.
+# Events are tuples whose first element is the kind:
+#   ("start", name, attrs, self_closing)  attrs is a list of [name, value]
+#   ("end", name)
+#   ("text", raw_text)                    entities are left as written
+#   ("comment" | "cdata" | "decl" | "pi", raw_markup)
+
+_TOKEN_PATTERN = re.compile(
+    r"(?P<comment><!--.*?-->)"
+    r"|(?P<cdata><!\[CDATA\[.*?\]\]>)"
+    r"|(?P<decl><![^>]*>)"
+    r"|(?P<pi><\?.*?\?>)"
+    r"|</(?P<end>[^\s/>]+)\s*>"
+    r"|<(?P<start>[A-Za-z][^\s/>]*)"
+    r"(?P<attrs>(?:\s+[^\s=/>]+(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'>]+))?)*)"
+    r"\s*(?P<close>/?)>",
+    re.S,
+)
+
+_ATTR_PATTERN = re.compile(
+    r"([^\s=/>]+)(?:\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s\"'>]+)))?"
+)
+
+# Elements whose content is not markup and must be passed through untouched.
+RAW_TEXT_ELEMENTS = {"script", "style"}
+
+# Elements inside which whitespace is significant.
+PRESERVE_WHITESPACE_ELEMENTS = {"pre", "textarea", "script", "style"}
+
+# fmt: off
+# Whitespace next to these elements never affects rendering.
+BLOCK_ELEMENTS = {
+    "html", "head", "body", "title", "meta", "link", "style", "script",
+    "p", "div", "section", "article", "aside", "header", "footer", "nav",
+    "main", "figure", "figcaption", "blockquote", "pre", "hr", "br",
+    "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li", "dl", "dt", "dd",
+    "table", "caption", "thead", "tbody", "tfoot", "tr", "th", "td",
+}
+# fmt: on
+
+# Attributes that point at other files in the book.
+REFERENCE_ATTRIBUTES = {"src", "href", "xlink:href", "poster", "data"}
+
+# Only XML whitespace is layout. NBSP, ideographic spaces and the like are
+# content (spacer paragraphs, verse indents) and must survive minification.
+XML_WHITESPACE = " \t\n\r"
+_WHITESPACE_RUN = re.compile(r"[ \t\n\r]+")
+
+
+def local_name(name):
+    return name.rpartition(":")[2].lower()
+
+
+def parse(markup):
+    """
+    Tokenizes XHTML into an event stream.
+
+    Args:
+        markup (str): The decoded document.
+
+    Yields:
+        tuple: One event per tag, text run, comment or declaration.
+
+    Raises:
+        ValueError: If the markup contains a '<' that does not start a token.
+    """
+    pos = 0
+    length = len(markup)
+    while pos < length:
+        match = _TOKEN_PATTERN.search(markup, pos)
+        text_end = match.start() if match else length
+        if text_end > pos:
+            text = markup[pos:text_end]
+            if "<" in text:
+                raise ValueError(f"malformed markup near offset {pos}")
+            yield ("text", text)
+        if not match:
+            break
+
+        pos = match.end()
+        kind = match.lastgroup
+        if match.group("start"):
+            name = match.group("start")
+            attrs = [
+                [attr.group(1), _attr_value(attr)]
+                for attr in _ATTR_PATTERN.finditer(match.group("attrs"))
+            ]
+            self_closing = bool(match.group("close"))
+            yield ("start", name, attrs, self_closing)
+
+            if not self_closing and local_name(name) in RAW_TEXT_ELEMENTS:
+                close = re.compile(rf"</{re.escape(name)}\s*>", re.I)
+                end_match = close.search(markup, pos)
+                if not end_match:
+                    raise ValueError(f"unterminated <{name}> element")
+                if end_match.start() > pos:
+                    yield ("text", markup[pos : end_match.start()])
+                yield ("end", name)
+                pos = end_match.end()
+        elif match.group("end"):
+            yield ("end", match.group("end"))
+        else:
+            yield (kind, match.group(0))
+
+
+def _attr_value(match):
+    """Returns the unquoted value of an attribute match, or None if it has none."""
+    for group in (2, 3, 4):
+        if match.group(group) is not None:
+            return match.group(group)
+    return None
+
+
+def serialize(events):
+    """
+    Turns an event stream back into markup.
+
+    Args:
+        events (iterable): The events to write.
+
+    Returns:
+        str: The serialized document.
+    """
+    parts = []
+    for event in events:
+        kind = event[0]
+        if kind == "start":
+            _, name, attrs, self_closing = event
+            parts.append("<" + name)
+            for attr, value in attrs:
+                if value is None:
+                    parts.append(" " + attr)
+                else:
+                    parts.append(f' {attr}="{value.replace(chr(34), "&quot;")}"')
+            parts.append("/>" if self_closing else ">")
+        elif kind == "end":
+            parts.append(f"</{event[1]}>")
+        else:
+            parts.append(event[1])
+    return "".join(parts)
+
+
+# --- References ---
+
+
+def resolve_reference(base_name, reference):
+    """
+    Resolves a relative link found in one manifest file to the file name of
+    the item it points at.
+
+    Args:
+        base_name (str): File name of the item containing the link.
+        reference (str): The link as written (may carry a query or fragment).
+
+    Returns:
+        str: The target file name, or None for external, data: and
+             fragment-only links.
+    """
+    parts = urlsplit(reference.strip())
+    if parts.scheme or parts.netloc or not parts.path:
+        return None
+    path = posixpath.join(posixpath.dirname(base_name), unquote(parts.path))
+    return posixpath.normpath(path)
+
+
+def redirect_reference(base_name, reference, redirects):
+    """
+    Points a link at a different file if its target appears in redirects,
+    keeping any query and fragment.
+
+    Args:
+        base_name (str): File name of the item containing the link.
+        reference (str): The link as written.
+        redirects (dict): Maps old target file names to new ones.
+
+    Returns:
+        str: The rewritten link, or the original if it needs no change.
+    """
+    target = resolve_reference(base_name, reference)
+    if target not in redirects:
+        return reference
+
+    parts = urlsplit(reference.strip())
+    new_path = posixpath.relpath(redirects[target], posixpath.dirname(base_name) or ".")
+    new_reference = quote(new_path)
+    if parts.query:
+        new_reference += "?" + parts.query
+    if parts.fragment:
+        new_reference += "#" + parts.fragment
+    return new_reference
+
+
+# --- Transforms ---
+#
+# A transform is a generator function taking (events, context) and yielding
+# events. A transform may also record what it sees in the shared context dict
+# for the caller to read after process_document() returns.
+
+DOCUMENT_TRANSFORMS = {}
+
+
+def register_transform(name, transform):
+    """
+    Makes a transform available to process_document() under a name.
+
+    Args:
+        name (str): The name callers use to enable the transform.
+        transform (callable): A generator function taking (events, context).
+    """
+    DOCUMENT_TRANSFORMS[name] = transform
+
+
+def minify_transform(events, context):
+    """
+    Drops comments and collapses layout whitespace, leaving the content of
+    pre, textarea, script and style alone. Whitespace-only text is removed
+    next to block elements and reduced to one space elsewhere, so spacing
+    between inline elements survives.
+    """
+    preserve_depth = 0
+    pending_space = False
+    after_block = True
+
+    for event in events:
+        kind = event[0]
+
+        if kind == "comment":
+            continue
+
+        if kind == "text" and not preserve_depth:
+            text = _WHITESPACE_RUN.sub(" ", event[1])
+            if text == " ":
+                pending_space = pending_space or not after_block
+                continue
+            if pending_space and not text.startswith(" "):
+                text = " " + text
+            if after_block:
+                text = text.lstrip(XML_WHITESPACE)
+            pending_space = False
+            after_block = False
+            if text:
+                yield ("text", text)
+            continue
+
+        if kind in ("start", "end"):
+            name = local_name(event[1])
+            is_block = name in BLOCK_ELEMENTS
+            if pending_space and not is_block:
+                yield ("text", " ")
+            pending_space = False
+            after_block = is_block
+
+            if name in PRESERVE_WHITESPACE_ELEMENTS:
+                if kind == "start" and not event[3]:
+                    preserve_depth += 1
+                elif kind == "end" and preserve_depth:
+                    preserve_depth -= 1
+        elif kind != "text":
+            pending_space = False
+            after_block = True
+
+        yield event
+
+
+def inline_images_transform(events, context):
+    """
+    Recompresses base64 data: images embedded in attributes (src, href,
+    style and so on) with context['image_options'].
+    """
+    options = context.get("image_options") or {}
+    for event in events:
+        if event[0] == "start":
+            for attr in event[2]:
+                if attr[1] and "data:image/" in attr[1]:
+                    attr[1] = compressor.compress_data_uris(attr[1], options)
+        yield event
+
+
+def rewrite_references_transform(events, context):
+    """
+    Repoints links at merged duplicates, using context['redirects'] and the
+    page's own context['file_name']. This covers link attributes as well as
+    url(...) in style attributes and <style> elements.
+    """
+    from .dedupe import rewrite_css_references  # dedupe imports this module
+
+    redirects = context.get("redirects") or {}
+    base_name = context.get("file_name", "")
+    in_style = False
+    for event in events:
+        if redirects:
+            if event[0] == "start":
+                for attr in event[2]:
+                    if not attr[1]:
+                        continue
+                    name = attr[0].lower()
+                    if name in REFERENCE_ATTRIBUTES:
+                        attr[1] = redirect_reference(base_name, attr[1], redirects)
+                    elif name == "style" and "url(" in attr[1]:
+                        attr[1] = rewrite_css_references(attr[1], base_name, redirects)
+                in_style = local_name(event[1]) == "style" and not event[3]
+            elif event[0] == "end":
+                in_style = False
+            elif event[0] == "text" and in_style and "url(" in event[1]:
+                event = ("text", rewrite_css_references(event[1], base_name, redirects))
+        yield event
+
+
+register_transform("minify", minify_transform)
+register_transform("inline_images", inline_images_transform)
+register_transform("rewrite_references", rewrite_references_transform)
+
+
+# --- Pipeline ---
+
+
+def _repair_markup(markup):
+    """Falls back to BeautifulSoup to re-serialize markup our tokenizer rejects."""
+    from bs4 import BeautifulSoup
+
+    return str(BeautifulSoup(markup, "html.parser"))
+
+
+def process_document(content_bytes, transforms, context=None, repair=True):
+    """
+    Parses a UTF-8 XHTML (or other XML) document once, runs the named
+    transforms over the event stream in order, and serializes the result once.
+
+    Args:
+        content_bytes (bytes): Raw bytes of the document.
+        transforms (list): Names of registered transforms to apply.
+        context (dict): Settings for the transforms; results they record
+                        are added to it in place.
+        repair (bool): Retry markup the tokenizer rejects through
+                       BeautifulSoup. Its HTML parser lowercases names, so
+                       this is off for case-sensitive formats such as SVG.
+
+    Returns:
+        bytes: The transformed document, or None if it could not be processed.
+    """
+    try:
+        markup = str(content_bytes, "utf-8")
+    except UnicodeDecodeError as e:
+        print(f"Could not decode document: {e}")
+        return None
+
+    for attempt in ("parse", "repair") if repair else ("parse",):
+        try:
+            if attempt == "repair":
+                markup = _repair_markup(markup)
+            # Transforms fill a scratch copy so a failed first attempt does
+            # not leave partial results behind.
+            scratch = dict(context or {})
+            stream = parse(markup)
+            for name in transforms:
+                stream = DOCUMENT_TRANSFORMS[name](stream, scratch)
+            result = serialize(stream).encode("utf-8")
+            if context is not None:
+                context.update(scratch)
+            return result
+        except ValueError as e:
+            print(f"Could not {attempt} document: {e}")
+        except Exception as e:
+            print(f"Could not process document: {e}")
+            return None
+
+    return None
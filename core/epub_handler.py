@@ -2,9 +2,28 @@
 import os
 import shutil
 
-# CORRECTED IMPORT: ITEM constants are in the top-level ebooklib module
-from ebooklib import epub, ITEM_IMAGE, ITEM_DOCUMENT, ITEM_STYLE, ITEM_FONT
-from . import compressor
+# CORRECTED IMPORT: ITEM constants are in the top-level ebooklib module.
+# ebooklib.epub (and lxml behind it) is imported where a book is opened, so
+# importing this module for DEFAULT_OPTIONS stays cheap.
+from ebooklib import ITEM_IMAGE, ITEM_DOCUMENT, ITEM_STYLE, ITEM_FONT
+from . import dedupe, document, pipeline, probe, validate
+
+# The settings the GUI starts with, for callers that run without it.
+DEFAULT_OPTIONS = {
+    "compress_images": True,
+    "minify_html": True,
+    "minify_css": True,
+    "strip_fonts": False,
+    "skip_optimized": True,
+    "dedupe_assets": True,
+    "validate_output": True,
+    "image_options": {
+        "quality": 75,
+        "max_width": 1200,
+        "max_height": 1600,
+        "convert_to_jpeg": True,
+    },
+}
 
 
 def get_epub_info(path):
@@ -12,6 +31,8 @@ def get_epub_info(path):
     if not os.path.exists(path):
         return None
 
+    from ebooklib import epub
+
     book = epub.read_epub(path)
     total_size = os.path.getsize(path)
 
@@ -31,21 +52,24 @@ def get_epub_info(path):
     }
 
     for item in book.get_items():
-        size = len(item.get_content())
+        # Use the stored bytes directly: get_content() on documents re-renders
+        # the whole page through lxml just to be measured.
+        size = len(item.content or b"")
         name = item.get_name()
         info["file_list"].append(name)
 
         # CORRECTED: Removed 'epub.' prefix from ITEM constants
-        if item.get_type() == ITEM_IMAGE:
+        item_type = item.get_type()
+        if item_type == ITEM_IMAGE:
             info["images"] += 1
             info["image_size"] += size
-        elif item.get_type() == ITEM_DOCUMENT:
+        elif item_type == ITEM_DOCUMENT:
             info["html"] += 1
             info["html_size"] += size
-        elif item.get_type() == ITEM_STYLE:
+        elif item_type == ITEM_STYLE:
             info["css"] += 1
             info["css_size"] += size
-        elif item.get_type() == ITEM_FONT:
+        elif item_type == ITEM_FONT:
             info["fonts"] += 1
             info["font_size"] += size
         else:
@@ -101,84 +125,184 @@ def estimate_compressed_size(info, options):
     return {"estimated_size": estimated_size, "reduction_percent": reduction_percent}
 
 
+def _verbatim_document(item, content):
+    """
+    Copies an EpubHtml into a plain EpubItem so ebooklib writes our serialized
+    bytes as-is instead of re-rendering (and re-indenting) the page.
+    """
+    from ebooklib import epub
+
+    replacement = epub.EpubItem(
+        uid=item.id,
+        file_name=item.file_name,
+        media_type=item.media_type,
+        content=content,
+    )
+    replacement.book = item.book
+    replacement.is_linear = item.is_linear
+    replacement.properties = item.properties
+    replacement.media_overlay = item.media_overlay
+    replacement.media_duration = item.media_duration
+    return replacement
+
+
+def _protected_names(book):
+    """File names of items the OPF points at directly, such as the cover."""
+    from ebooklib import epub
+
+    cover_ids = {attrs.get("content") for _, attrs in book.get_metadata("OPF", "cover")}
+    return {
+        item.get_name()
+        for item in book.get_items()
+        if isinstance(item, epub.EpubCover) or item.get_id() in cover_ids
+    }
+
+
 def compress_epub_file(
     input_path, output_path, options, log_callback, progress_callback
 ):
     """
     The main function that orchestrates the EPUB compression process.
     """
+    from ebooklib import epub
+
     original_size = os.path.getsize(input_path)
     log_callback(f"Starting compression for: {os.path.basename(input_path)}")
     log_callback(f"Original size: {original_size / 1024 / 1024:.2f} MB")
 
     book = epub.read_epub(input_path)
-    items_to_process = list(book.get_items())
-    total_items = len(items_to_process)
     items_to_remove = []
+    replacements = {}
+    jobs = []
 
-    # --- Processing Loop ---
-    for i, item in enumerate(items_to_process):
-        progress = int((i + 1) / total_items * 100)
-        file_name = item.get_name()
-        original_item_size = len(item.get_content())
+    if options.get("strip_fonts"):
+        log_callback("Stripping fonts and their @font-face rules...")
 
-        # CORRECTED: Removed 'epub.' prefix from ITEM constants
-        # 1. Compress Images
-        if item.get_type() == ITEM_IMAGE and options.get("compress_images"):
-            progress_callback(progress, f"Compressing image: {file_name}")
-            compressed_bytes, new_ext = compressor.compress_image(
-                item.get_content(), options["image_options"]
-            )
-            if len(compressed_bytes) < original_item_size:
-                item.set_content(compressed_bytes)
-                if new_ext and not file_name.endswith(new_ext):
-                    # To properly handle file name changes, we need to update references.
-                    # This is complex. For now, we'll just log it.
-                    # A full implementation would parse HTML/CSS to update paths.
-                    log_callback(
-                        f"  - Compressed {file_name} ({original_item_size / 1024:.1f} KB -> {len(compressed_bytes) / 1024:.1f} KB)"
-                    )
-            else:
-                log_callback(f"  - Skipped {file_name}, no size improvement.")
-
-        # 2. Minify HTML
-        elif item.get_type() == ITEM_DOCUMENT and options.get("minify_html"):
-            progress_callback(progress, f"Minifying HTML: {file_name}")
-            minified_content = compressor.minify_content(item.get_content(), "html")
-            item.set_content(minified_content)
-
-        # 3. Minify CSS
-        elif item.get_type() == ITEM_STYLE and options.get("minify_css"):
-            progress_callback(progress, f"Minifying CSS: {file_name}")
-            minified_content = compressor.minify_content(item.get_content(), "css")
-            item.set_content(minified_content)
-
-        # 4. Mark Fonts for Removal
-        elif item.get_type() == ITEM_FONT and options.get("strip_fonts"):
-            log_callback(f"Marking font for removal: {file_name}")
+    # 1. Mark Fonts for Removal
+    for item in book.get_items():
+        if item.get_type() == ITEM_FONT and options.get("strip_fonts"):
+            log_callback(f"Marking font for removal: {item.get_name()}")
             items_to_remove.append(item)
 
-        progress_callback(progress, "Processing...")
+    # 2. Find duplicate assets. Links to them are repointed at the kept copy
+    #    by the stages; a duplicate is dropped afterwards only if no link to
+    #    it is left (see step 4).
+    redirects = {}
+    duplicates = []
+    if options.get("dedupe_assets", True):
+        candidates = [item for item in book.get_items() if item not in items_to_remove]
+        redirects = dedupe.find_duplicates(
+            [(i.get_name(), i.media_type, i.content or b"") for i in candidates],
+            keep=_protected_names(book),
+            compare_pixels=options.get("dedupe_pixels", False),
+        )
+        duplicates = [item for item in candidates if item.get_name() in redirects]
+
+    # Queue everything that is left for the stages. Nav, NCX and cover pages
+    # are regenerated by ebooklib on write.
+    excluded = items_to_remove + duplicates
+    for item in book.get_items():
+        if item not in excluded and not isinstance(
+            item, (epub.EpubNav, epub.EpubNcx, epub.EpubCoverHtml)
+        ):
+            # The stored bytes, not get_content(), which re-renders documents.
+            jobs.append((item, item.media_type, item.content or b"", item.get_name()))
+
+    # 3. Run the registered stages (images, documents, CSS) over every item.
+    #    Expensive stages run in parallel; results arrive here in order.
+    completed = 0
+
+    def on_result(item, label, new_content, notes):
+        nonlocal completed
+        completed += 1
+        progress = int(completed / len(jobs) * 100)
+        file_name = item.get_name()
+
+        for note in notes:
+            log_callback(f"  - {file_name}: {note}.")
+
+        if new_content is not None:
+            original_item_size = len(item.content or b"")
+            log_callback(
+                f"  - Compressed {file_name} ({original_item_size / 1024:.1f} KB -> {len(new_content) / 1024:.1f} KB)"
+            )
+            if type(item) is not epub.EpubHtml:
+                item.set_content(new_content)
+                # Re-encoding can change the format (PNG -> JPEG) under the
+                # same file name; the manifest must declare what is stored.
+                if item.media_type in validate.FORMAT_MEDIA_TYPES.values():
+                    new_format = probe.sniff_image_format(new_content)
+                    if new_format:
+                        item.media_type = validate.FORMAT_MEDIA_TYPES[new_format]
+
+        # Pages are always written from their stored bytes, changed or not:
+        # EpubHtml.get_content() would re-indent them and rebuild <head>,
+        # dropping stylesheet links.
+        if type(item) is epub.EpubHtml:
+            if new_content is None:
+                new_content = item.content or b""
+            replacements[item] = _verbatim_document(item, new_content)
+
+        progress_callback(
+            progress, f"{label}: {file_name}" if label else "Processing..."
+        )
+
+    pipeline.process_items(jobs, dict(options, redirects=redirects), on_result)
 
     # --- Post-Processing ---
 
-    # 5. If fonts were stripped, also remove their rules from CSS files
-    if options.get("strip_fonts"):
-        log_callback("Stripping @font-face rules from CSS files...")
-        # CORRECTED: Removed 'epub.' prefix from ITEM_STYLE
-        for item in book.get_items_of_type(ITEM_STYLE):
-            cleaned_css = compressor.strip_font_rules_from_css(item.get_content())
-            item.set_content(cleaned_css.encode("utf-8"))
+    # Swap in documents that must be written exactly as stored or serialized
+    if replacements:
+        book.items = [replacements.get(item, item) for item in book.items]
+
+    # 4. Index the links of what will be written. Not every referrer can be
+    #    rewritten (SVG images, pages that failed to parse), so a duplicate
+    #    that is still linked to is kept rather than left dangling.
+    link_index = {}
+    if duplicates or options.get("validate_output", True):
+        for item in book.get_items():
+            if item not in excluded and not isinstance(
+                item, (epub.EpubNav, epub.EpubNcx, epub.EpubCoverHtml)
+            ):
+                links = validate.index_links(item.media_type, item.content or b"")
+                if links:
+                    link_index[item.get_name()] = links
+
+    linked_from = {}
+    for file_name, links in link_index.items():
+        for link in links:
+            target = document.resolve_reference(file_name, link)
+            linked_from.setdefault(target, []).append(file_name)
+
+    for item in duplicates:
+        name = item.get_name()
+        if name in linked_from:
+            log_callback(
+                f"  - Kept duplicate {name}: still linked from "
+                f"{', '.join(sorted(set(linked_from[name])))}"
+            )
+        else:
+            log_callback(f"  - Merged duplicate {name} into {redirects[name]}")
+            items_to_remove.append(item)
 
     # Actually remove the marked items from the book manifest
     for item in items_to_remove:
         book.items.remove(item)
 
-    # 6. Rebuild and Save
+    # 5. Rebuild and Save
     log_callback("Rebuilding and saving compressed EPUB...")
     progress_callback(99, "Saving file...")
     epub.write_epub(output_path, book, {})
 
+    # 6. Validate the written file against the links of what went into it
+    problems = []
+    if options.get("validate_output", True):
+        problems = validate.validate_epub(output_path, link_index)
+        for problem in problems:
+            log_callback(f"  - Validation: {problem}.")
+        if not problems:
+            log_callback("Output passed validation checks.")
+
     # --- Final Stats ---
     final_size = os.path.getsize(output_path)
     reduction_bytes = original_size - final_size
@@ -196,4 +320,5 @@ def compress_epub_file(
         "original_size": original_size,
         "final_size": final_size,
         "reduction_percent": reduction_percent,
+        "problems": problems,
     }
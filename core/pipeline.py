@@ -0,0 +1,471 @@
+# core/pipeline.py
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from . import compressor, dedupe, document, probe, svg
+
+# --- Stage Registry ---
+#
+# A stage transforms the content of manifest items with certain media types.
+# Its run function takes (content_bytes, stage_options) and returns a tuple
+# (new_bytes_or_None, note_or_None); None means "leave the content as it is".
+# Run functions must live at module level so they can be sent to worker
+# processes, and stages must be registered when their module is imported.
+# Heavy third-party engines are imported lazily by the code that uses them;
+# a stage lists them in 'requires' so workers can preload just those.
+
+COST_INLINE = "inline"  # Cheap enough to run on the calling thread
+COST_IO = "io"  # Mostly waits on I/O; runs on a thread pool
+COST_CPU = "cpu"  # Heavy Python or codec work; runs on a process pool
+
+_COST_RANK = {COST_INLINE: 0, COST_IO: 1, COST_CPU: 2}
+
+STAGES = {}
+
+# Results of image chains, shared across books so assets that recur between
+# titles (publisher logos, ornaments) are encoded only once. Pages and
+# stylesheets are unique to their book and only deduplicated within it. Keys
+# count toward the limit too, as does a fixed overhead per entry.
+RESULT_CACHE_LIMIT = 64 * 1024 * 1024
+RESULT_CACHE_ENTRY_OVERHEAD = 256
+_result_cache = OrderedDict()
+_result_cache_size = 0
+
+
+def register_stage(
+    name,
+    media_types,
+    run,
+    cost=COST_CPU,
+    cacheable=True,
+    enabled_by=None,
+    options_key=None,
+    schema=None,
+    label=None,
+    uses_file_name=False,
+    requires=(),
+    reuse_across_books=False,
+):
+    """
+    Adds a stage to the registry. Stages run in registration order.
+
+    Args:
+        name (str): Unique stage name.
+        media_types (iterable): Manifest media types the stage handles.
+        run (callable): Module-level function taking (content, stage_options).
+        cost (str): COST_INLINE, COST_IO or COST_CPU; picks the executor.
+        cacheable (bool): True if equal input always gives equal output, so
+                          results can be reused for duplicate items.
+        enabled_by (str or tuple): Top-level option(s) that turn the stage
+                          on; any one is enough. Stages without one are
+                          always on.
+        options_key (str): Key of the options sub-dict holding its settings.
+        schema (dict): Maps setting name to (type, default).
+        label (str): Verb phrase shown in progress messages.
+        uses_file_name (bool): Add the item's file name to its settings as
+                               'file_name', for stages that resolve links.
+        requires (iterable): Modules the stage imports lazily on every run,
+                             for required_modules().
+        reuse_across_books (bool): Keep results of a cacheable chain made up
+                             only of such stages for later books too.
+    """
+    if cost not in _COST_RANK:
+        raise ValueError(f"Unknown cost class '{cost}' for stage '{name}'")
+    if isinstance(enabled_by, str):
+        enabled_by = (enabled_by,)
+    STAGES[name] = {
+        "name": name,
+        "media_types": frozenset(media_types),
+        "run": run,
+        "cost": cost,
+        "cacheable": cacheable,
+        "enabled_by": enabled_by,
+        "options_key": options_key,
+        "schema": schema or {},
+        "label": label or name,
+        "uses_file_name": uses_file_name,
+        "requires": tuple(requires),
+        "reuse_across_books": reuse_across_books,
+    }
+
+
+def resolve_options(stage, options):
+    """
+    Builds the settings a stage runs with, checking them against its schema.
+    Each setting is looked up in the stage's options sub-dict, then in the
+    top-level options, then falls back to the schema default.
+
+    Raises:
+        ValueError: If a setting has the wrong type.
+    """
+    section = options.get(stage["options_key"]) or {}
+    resolved = {}
+    for key, (expected_type, default) in stage["schema"].items():
+        value = section.get(key, options.get(key, default))
+        if value is not None and not isinstance(value, expected_type):
+            raise ValueError(
+                f"Option '{key}' for stage '{stage['name']}' must be "
+                f"{expected_type.__name__}, got {type(value).__name__}"
+            )
+        resolved[key] = value
+    return resolved
+
+
+def enabled_stages(options):
+    """Returns (stage, stage_options) for every stage the options turn on."""
+    return [
+        (stage, resolve_options(stage, options))
+        for stage in STAGES.values()
+        if stage["enabled_by"] is None
+        or any(options.get(key) for key in stage["enabled_by"])
+    ]
+
+
+def required_modules(options):
+    """Returns the lazily imported modules the enabled stages will need."""
+    modules = []
+    for stage, _ in enabled_stages(options):
+        modules.extend(m for m in stage["requires"] if m not in modules)
+    return modules
+
+
+def run_stages(names, content, stage_options):
+    """
+    Runs a chain of stages over one item's content. This is the unit of work
+    handed to executors, so it only takes picklable arguments.
+
+    Returns:
+        tuple: (new_bytes_or_None, list_of_notes)
+    """
+    current = content
+    notes = []
+    for name, opts in zip(names, stage_options):
+        new_content, note = STAGES[name]["run"](current, opts)
+        if new_content is not None:
+            current = new_content
+        if note:
+            notes.append(note)
+    return (None if current is content else current), notes
+
+
+# --- Scheduler ---
+
+
+def _make_executor(cost, workers):
+    if cost == COST_CPU:
+        # multiprocessing is slow to import, and single-worker runs never need it.
+        from concurrent.futures import ProcessPoolExecutor
+
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def _cache_get(cache_key):
+    result = _result_cache.get(cache_key)
+    if result is not None:
+        _result_cache.move_to_end(cache_key)
+    return result
+
+
+def _cache_entry_size(cache_key, result):
+    names, _, chain_options = cache_key
+    return (
+        len(result[0])
+        + len(chain_options)
+        + sum(len(name) for name in names)
+        + RESULT_CACHE_ENTRY_OVERHEAD
+    )
+
+
+def _cache_put(cache_key, result):
+    global _result_cache_size
+    if result[0] is None or cache_key in _result_cache:
+        return  # Skips are cheap to rediscover; don't let them evict encodes
+    size = _cache_entry_size(cache_key, result)
+    if size > RESULT_CACHE_LIMIT:
+        return
+    _result_cache[cache_key] = result
+    _result_cache_size += size
+    while _result_cache_size > RESULT_CACHE_LIMIT:
+        evicted_key, evicted = _result_cache.popitem(last=False)
+        _result_cache_size -= _cache_entry_size(evicted_key, evicted)
+
+
+def process_items(jobs, options, on_result):
+    """
+    Runs the enabled stages over a batch of items. Each item's chain of
+    stages is placed on the executor matching its most expensive stage, and
+    results are delivered on the calling thread in submission order.
+
+    Args:
+        jobs (list): (key, media_type, content, file_name) tuples.
+        options (dict): Compression options; 'workers' caps pool sizes.
+        on_result (callable): Called as (key, label, new_bytes_or_None, notes)
+                              for every job, including ones no stage handles.
+    """
+    stages = enabled_stages(options)
+    workers = options.get("workers") or os.cpu_count() or 1
+    executors = {}
+    shared = {}  # Cache key -> future, so identical items are encoded once
+    tasks = []
+
+    try:
+        for key, media_type, content, file_name in jobs:
+            chain = [(s, o) for s, o in stages if media_type in s["media_types"]]
+            if not chain:
+                tasks.append((key, None, None, None))
+                continue
+
+            names = [stage["name"] for stage, _ in chain]
+            chain_options = [
+                dict(opts, file_name=file_name) if stage["uses_file_name"] else opts
+                for stage, opts in chain
+            ]
+            label = chain[-1][0]["label"]
+
+            cache_key = None
+            reuse = all(stage["reuse_across_books"] for stage, _ in chain)
+            if all(stage["cacheable"] for stage, _ in chain):
+                cache_key = (
+                    tuple(names),
+                    hashlib.sha1(content).digest(),
+                    repr(chain_options),
+                )
+                if cache_key in shared:
+                    tasks.append((key, label, shared[cache_key], None))
+                    continue
+                cached = _cache_get(cache_key) if reuse else None
+                if cached is not None:
+                    future = Future()
+                    future.set_result(cached)
+                    shared[cache_key] = future
+                    tasks.append((key, label, future, None))
+                    continue
+
+            cost = max((stage["cost"] for stage, _ in chain), key=_COST_RANK.get)
+            if cost == COST_INLINE or workers <= 1:
+                future = Future()
+                future.set_result(run_stages(names, content, chain_options))
+            else:
+                if cost not in executors:
+                    executors[cost] = _make_executor(cost, workers)
+                future = executors[cost].submit(
+                    run_stages, names, content, chain_options
+                )
+
+            if cache_key is not None:
+                shared[cache_key] = future
+            tasks.append((key, label, future, cache_key if reuse else None))
+
+        for key, label, future, cache_key in tasks:
+            if future is None:
+                on_result(key, None, None, [])
+                continue
+            result = future.result()
+            if cache_key is not None:
+                _cache_put(cache_key, result)
+            new_content, notes = result
+            on_result(key, label, new_content, notes)
+    finally:
+        for executor in executors.values():
+            executor.shutdown(cancel_futures=True)
+
+
+# --- Built-in Stages ---
+
+
+def _run_image(content, options):
+    if options["skip_optimized"]:
+        reason = probe.should_skip_image(probe.probe_image(content), options)
+        if reason:
+            return None, f"skipped, {reason}"
+
+    compressed_bytes, _ = compressor.compress_image(content, options)
+    if len(compressed_bytes) >= len(content):
+        return None, "skipped, no size improvement"
+    return compressed_bytes, None
+
+
+def _run_document(content, options):
+    transforms = []
+    # A cheap byte scan keeps pages without inline images on the skip path.
+    if options["compress_images"] and b"data:image/" in content:
+        transforms.append("inline_images")
+    if options["redirects"]:
+        transforms.append("rewrite_references")
+    if options["minify_html"]:
+        transforms.append("minify")
+    transforms.extend(options["transforms"])
+
+    if (
+        options["skip_optimized"]
+        and transforms == ["minify"]
+        and probe.is_minified(content, "html")
+    ):
+        return None, "skipped, already minified"
+    if not transforms:
+        return None, None
+
+    image_options = dict(options["image_options"])
+    image_options.setdefault("skip_optimized", options["skip_optimized"])
+    new_content = document.process_document(
+        content,
+        transforms,
+        {
+            "image_options": image_options,
+            "redirects": options["redirects"],
+            "file_name": options["file_name"],
+        },
+    )
+    if new_content is None or new_content == content:
+        return None, None
+    return new_content, None
+
+
+def _run_svg(content, options):
+    new_content = svg.optimize_svg(content, options)
+    if len(new_content) >= len(content):
+        return None, "skipped, no size improvement"
+    return new_content, None
+
+
+def _run_strip_fonts(content, options):
+    new_content = compressor.strip_font_rules_from_css(content)
+    return (None if new_content is content else new_content), None
+
+
+def _run_css_inline_images(content, options):
+    if b"data:image/" not in content:
+        return None, None
+
+    try:
+        css = str(content, "utf-8")
+    except UnicodeDecodeError as e:
+        print(f"Could not decode CSS: {e}")
+        return None, None
+
+    new_content = compressor.compress_data_uris(css, options).encode("utf-8")
+    if len(new_content) >= len(content):
+        return None, None
+    return new_content, None
+
+
+def _run_css_references(content, options):
+    if b"url(" not in content:
+        return None, None
+
+    try:
+        css = str(content, "utf-8")
+    except UnicodeDecodeError as e:
+        print(f"Could not decode CSS: {e}")
+        return None, None
+
+    new_css = dedupe.rewrite_css_references(
+        css, options["file_name"], options["redirects"]
+    )
+    if new_css == css:
+        return None, None
+    return new_css.encode("utf-8"), None
+
+
+def _run_minify_css(content, options):
+    if options["skip_optimized"] and probe.is_minified(content, "css"):
+        return None, "skipped, already minified"
+
+    new_content = compressor.minify_content(content, "css")
+    if len(new_content) >= len(content):
+        return None, None
+    return new_content, None
+
+
+IMAGE_SCHEMA = {
+    "quality": (int, 75),
+    "max_width": (int, None),
+    "max_height": (int, None),
+    "convert_to_jpeg": (bool, True),
+    "skip_optimized": (bool, True),
+}
+
+register_stage(
+    "images",
+    ("image/jpeg", "image/png", "image/gif", "image/webp"),
+    _run_image,
+    cost=COST_CPU,
+    enabled_by="compress_images",
+    options_key="image_options",
+    schema=IMAGE_SCHEMA,
+    label="Compressing image",
+    requires=("PIL.Image",),
+    reuse_across_books=True,
+)
+register_stage(
+    "svg",
+    ("image/svg+xml",),
+    _run_svg,
+    cost=COST_CPU,
+    enabled_by="compress_images",
+    options_key="svg_options",
+    schema={"precision": (int, 3)},
+    label="Optimizing SVG",
+    reuse_across_books=True,
+)
+register_stage(
+    "documents",
+    ("application/xhtml+xml", "text/html"),
+    _run_document,
+    cost=COST_CPU,
+    enabled_by=("minify_html", "compress_images", "redirects"),
+    options_key="document_options",
+    schema={
+        # Extra registered document transforms to run on every page
+        "transforms": (list, []),
+        "minify_html": (bool, False),
+        "compress_images": (bool, False),
+        "image_options": (dict, {}),
+        "redirects": (dict, {}),
+        "skip_optimized": (bool, True),
+    },
+    label="Processing document",
+    uses_file_name=True,
+)
+register_stage(
+    "strip_fonts",
+    ("text/css",),
+    _run_strip_fonts,
+    cost=COST_INLINE,
+    enabled_by="strip_fonts",
+    label="Stripping fonts",
+)
+register_stage(
+    "css_references",
+    ("text/css",),
+    _run_css_references,
+    cost=COST_INLINE,
+    enabled_by="redirects",
+    schema={"redirects": (dict, {})},
+    label="Updating links",
+    uses_file_name=True,
+)
+register_stage(
+    "css_inline_images",
+    ("text/css",),
+    _run_css_inline_images,
+    cost=COST_CPU,
+    enabled_by="compress_images",
+    options_key="image_options",
+    schema=IMAGE_SCHEMA,
+    label="Compressing inline images",
+    requires=("PIL.Image",),
+)
+register_stage(
+    "minify_css",
+    ("text/css",),
+    _run_minify_css,
+    cost=COST_CPU,
+    enabled_by="minify_css",
+    schema={"skip_optimized": (bool, True)},
+    label="Minifying CSS",
+    requires=("cssmin",),
+)
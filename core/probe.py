@@ -0,0 +1,353 @@
+# core/probe.py
+import struct
+
+# --- Thresholds ---
+
+# A JPEG whose estimated quality is already at or below the target quality
+# (plus this margin) will not get meaningfully smaller from a re-encode.
+JPEG_QUALITY_MARGIN = 5
+
+# Below these bits-per-pixel figures an image is already tightly packed and
+# a lossy re-encode at any sensible quality rarely beats it. The JPEG figure
+# is only used when the quantization tables give no quality estimate.
+MIN_JPEG_BPP = 0.3
+MIN_WEBP_BPP = 0.3
+MIN_PNG_BPP = 0.5
+
+# Text files whose whitespace makes up less than this share of the sampled
+# bytes (and that contain no comments) are treated as already minified.
+MINIFIED_WHITESPACE_RATIO = 0.02
+TEXT_SAMPLE_SIZE = 64 * 1024
+
+# fmt: off
+# IJG standard luminance quantization table, in zigzag order as stored in
+# a JPEG DQT segment.
+_STD_LUMINANCE_QTABLE = (
+    16, 11, 12, 14, 12, 10, 16, 14,
+    13, 14, 18, 17, 16, 19, 24, 40,
+    26, 24, 22, 22, 24, 49, 35, 37,
+    29, 40, 58, 51, 61, 60, 57, 51,
+    56, 55, 64, 72, 92, 78, 64, 68,
+    87, 69, 55, 56, 80, 109, 81, 87,
+    95, 98, 103, 104, 103, 62, 77, 113,
+    121, 112, 100, 120, 92, 101, 103, 99,
+)
+
+# SOFn markers carrying frame dimensions (excludes DHT, JPG and DAC).
+_JPEG_SOF_MARKERS = {
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF,
+}
+# fmt: on
+
+# Maps each libjpeg luminance table to its quality; built on first use.
+_IJG_QUALITIES = None
+
+
+# --- Image Probing ---
+
+
+def probe_image(image_bytes):
+    """
+    Reads the headers of an image without decoding any pixel data.
+
+    Args:
+        image_bytes (bytes): The raw bytes of the image.
+
+    Returns:
+        dict: Header information, or None if the format is not recognised.
+              - 'format' (str): 'JPEG', 'PNG', 'WEBP' or 'GIF'.
+              - 'width' (int), 'height' (int): Pixel dimensions.
+              - 'bpp' (float): Bits per pixel of the stored data.
+              - 'quality' (int): Estimated JPEG quality, or None.
+              - 'lossless' (bool): True if the stored data is lossless.
+              - 'alpha' (bool): True if the image carries transparency.
+              - 'animated' (bool): True for animated WEBP.
+    """
+    # Header fields are sliced out of a memoryview so no chunk is ever copied.
+    image_bytes = memoryview(image_bytes)
+    image_format = sniff_image_format(image_bytes)
+    if image_format is None:
+        return None
+
+    try:
+        info = _PROBES[image_format](image_bytes)
+    except (struct.error, IndexError, ValueError) as e:
+        print(f"Could not probe image: {e}")
+        return None
+
+    if not info or not info["width"] or not info["height"]:
+        return None
+
+    info["bpp"] = len(image_bytes) * 8 / (info["width"] * info["height"])
+    return info
+
+
+def sniff_image_format(head):
+    """
+    Identifies a raster image from its magic bytes.
+
+    Args:
+        head (bytes): At least the first 12 bytes of the file.
+
+    Returns:
+        str: 'JPEG', 'PNG', 'WEBP' or 'GIF', or None if not recognised.
+    """
+    if head[:3] == b"\xff\xd8\xff":
+        return "JPEG"
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return "PNG"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    return None
+
+
+def _new_info(image_format):
+    return {
+        "format": image_format,
+        "width": 0,
+        "height": 0,
+        "bpp": 0.0,
+        "quality": None,
+        "lossless": False,
+        "alpha": False,
+        "animated": False,
+    }
+
+
+def _probe_jpeg(data):
+    """Walks JPEG marker segments up to the start of scan."""
+    info = _new_info("JPEG")
+    luminance_table = None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("corrupt JPEG marker")
+        marker = data[pos + 1]
+        if marker == 0xFF:  # Fill byte
+            pos += 1
+            continue
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):  # End of image / start of scan
+            break
+
+        (length,) = struct.unpack(">H", data[pos + 2 : pos + 4])
+        segment = data[pos + 4 : pos + 2 + length]
+
+        if marker == 0xDB and luminance_table is None:
+            luminance_table = _read_luminance_qtable(segment)
+        elif marker in _JPEG_SOF_MARKERS:
+            info["height"], info["width"] = struct.unpack(">HH", segment[1:5])
+            info["lossless"] = marker in (0xC3, 0xC7, 0xCB, 0xCF)
+
+        pos += 2 + length
+
+    if luminance_table:
+        info["quality"] = _estimate_jpeg_quality(luminance_table)
+    return info
+
+
+def _read_luminance_qtable(segment):
+    """Returns table 0 from a DQT segment, which may hold several tables."""
+    pos = 0
+    while pos < len(segment):
+        precision, table_id = segment[pos] >> 4, segment[pos] & 0x0F
+        size = 128 if precision else 64
+        fmt = ">64H" if precision else "64B"
+        values = struct.unpack(fmt, segment[pos + 1 : pos + 1 + size])
+        if table_id == 0:
+            return values
+        pos += 1 + size
+    return None
+
+
+def _estimate_jpeg_quality(table):
+    """
+    Recovers the quality setting a luminance table was produced with. Tables
+    from libjpeg (and therefore Pillow) are matched exactly; others get the
+    IJG quality scaling inverted over their average.
+    """
+    global _IJG_QUALITIES
+    if _IJG_QUALITIES is None:
+        # Low qualities clamp entries at 255, so several can share a table;
+        # the highest one wins, which errs toward re-encoding.
+        _IJG_QUALITIES = {_ijg_luminance_qtable(q): q for q in range(1, 101)}
+    if tuple(table) in _IJG_QUALITIES:
+        return _IJG_QUALITIES[tuple(table)]
+
+    scale = sum(q * 100.0 / std for q, std in zip(table, _STD_LUMINANCE_QTABLE)) / len(
+        _STD_LUMINANCE_QTABLE
+    )
+    if scale <= 0:
+        return 100
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return max(1, min(100, int(round(quality))))
+
+
+def _ijg_luminance_qtable(quality):
+    """The baseline table libjpeg writes for a quality setting."""
+    scale = 5000 // quality if quality < 50 else 200 - quality * 2
+    return tuple(
+        min(255, max(1, (std * scale + 50) // 100)) for std in _STD_LUMINANCE_QTABLE
+    )
+
+
+def _probe_png(data):
+    """Reads IHDR and notes whether a tRNS chunk is present."""
+    info = _new_info("PNG")
+    info["lossless"] = True
+    pos = 8
+    while pos + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[pos : pos + 8])
+        body = data[pos + 8 : pos + 8 + length]
+        if chunk_type == b"IHDR":
+            info["width"], info["height"] = struct.unpack(">II", body[:8])
+            color_type = body[9]
+            info["alpha"] = color_type in (4, 6)
+        elif chunk_type == b"tRNS":
+            info["alpha"] = True
+        elif chunk_type in (b"IDAT", b"IEND"):
+            # Ancillary chunks that matter to us all precede the image data.
+            break
+        pos += 12 + length
+    return info
+
+
+def _probe_webp(data):
+    """Reads the first chunk of a RIFF/WEBP container."""
+    info = _new_info("WEBP")
+    chunk_type = data[12:16]
+    body = data[20:]
+    if chunk_type == b"VP8X":
+        flags = body[0]
+        info["alpha"] = bool(flags & 0x10)
+        info["animated"] = bool(flags & 0x02)
+        info["width"] = 1 + int.from_bytes(body[4:7], "little")
+        info["height"] = 1 + int.from_bytes(body[7:10], "little")
+        info["lossless"] = _webp_chunk_types(data) & {b"VP8L", b"VP8 "} == {b"VP8L"}
+    elif chunk_type == b"VP8 ":
+        if body[3:6] != b"\x9d\x01\x2a":
+            raise ValueError("missing VP8 start code")
+        width, height = struct.unpack("<HH", body[6:10])
+        info["width"], info["height"] = width & 0x3FFF, height & 0x3FFF
+    elif chunk_type == b"VP8L":
+        if body[0] != 0x2F:
+            raise ValueError("missing VP8L signature")
+        bits = int.from_bytes(body[1:5], "little")
+        info["width"] = 1 + (bits & 0x3FFF)
+        info["height"] = 1 + ((bits >> 14) & 0x3FFF)
+        info["alpha"] = bool((bits >> 28) & 0x1)
+        info["lossless"] = True
+    else:
+        return None
+    return info
+
+
+def _webp_chunk_types(data):
+    """Collects the FourCCs of every top-level chunk in a WEBP file."""
+    chunk_types = set()
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_type = data[pos : pos + 4]
+        (length,) = struct.unpack("<I", data[pos + 4 : pos + 8])
+        chunk_types.add(chunk_type)
+        pos += 8 + length + (length & 1)
+    return chunk_types
+
+
+def _probe_gif(data):
+    """Reads the logical screen size from the GIF header."""
+    info = _new_info("GIF")
+    info["lossless"] = True
+    info["width"], info["height"] = struct.unpack("<HH", data[6:10])
+    return info
+
+
+_PROBES = {
+    "JPEG": _probe_jpeg,
+    "PNG": _probe_png,
+    "WEBP": _probe_webp,
+    "GIF": _probe_gif,
+}
+
+
+def should_skip_image(info, options):
+    """
+    Decides from probed headers whether re-encoding an image is pointless
+    under the given options.
+
+    Args:
+        info (dict): The result of probe_image().
+        options (dict): The same image options passed to compress_image().
+
+    Returns:
+        str: A short reason if the image should be skipped, otherwise None.
+    """
+    if not info:
+        return None
+
+    max_width = options.get("max_width")
+    max_height = options.get("max_height")
+    if max_width is not None and max_height is not None:
+        if info["width"] > max_width or info["height"] > max_height:
+            return None  # Resizing alone will shrink it
+
+    quality = options.get("quality", 75)
+
+    if info["format"] == "JPEG":
+        if info["lossless"]:
+            return None
+        if (
+            info["quality"] is not None
+            and info["quality"] <= quality + JPEG_QUALITY_MARGIN
+        ):
+            return f"already at quality ~{info['quality']}"
+        if info["quality"] is None and info["bpp"] < MIN_JPEG_BPP:
+            return f"already {info['bpp']:.2f} bpp"
+    elif info["format"] == "WEBP":
+        if info["animated"]:
+            return "animated WEBP"
+        if not info["lossless"] and info["bpp"] < MIN_WEBP_BPP:
+            return f"already {info['bpp']:.2f} bpp"
+    elif info["format"] == "PNG":
+        if info["bpp"] < MIN_PNG_BPP:
+            return f"already {info['bpp']:.2f} bpp"
+
+    return None
+
+
+# --- Text Probing ---
+
+
+def is_minified(content_bytes, file_type):
+    """
+    Guesses whether an HTML, CSS or JS file is already minified by sampling
+    its leading bytes for comments and layout whitespace.
+
+    Args:
+        content_bytes (bytes): Raw bytes of the text file.
+        file_type (str): 'html', 'css', or 'js'.
+
+    Returns:
+        bool: True if minifying is unlikely to save anything.
+    """
+    sample = bytes(content_bytes[:TEXT_SAMPLE_SIZE])
+    if not sample:
+        return True
+
+    if file_type == "html" and b"<!--" in sample:
+        return False
+    if file_type in ("css", "js") and b"/*" in sample:
+        return False
+
+    whitespace = (
+        sample.count(b"\n")
+        + sample.count(b"\t")
+        + sample.count(b"  ")
+        + sample.count(b"\r")
+    )
+    return whitespace / len(sample) < MINIFIED_WHITESPACE_RATIO
@@ -0,0 +1,400 @@
+# core/server.py
+import copy
+import json
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from . import watcher
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_UPLOAD = 512 * 1024 * 1024
+POOL_RETRY_DELAY = 1.0  # Seconds between attempts to start a replacement pool
+
+# Query parameters a request may use to override the server's options.
+BOOL_OPTIONS = {
+    "compress_images",
+    "minify_html",
+    "minify_css",
+    "strip_fonts",
+    "skip_optimized",
+    "dedupe_assets",
+    "dedupe_pixels",
+}
+# Integer image options and their (minimum, maximum); None means unbounded.
+IMAGE_INT_OPTIONS = {
+    "quality": (1, 100),
+    "max_width": (1, None),
+    "max_height": (1, None),
+}
+IMAGE_BOOL_OPTIONS = {"convert_to_jpeg"}
+
+_TRUE_VALUES = {"1", "true", "yes", "on"}
+_FALSE_VALUES = {"0", "false", "no", "off"}
+
+
+def options_from_query(base_options, query):
+    """
+    Applies per-request overrides from a query string to the server options.
+
+    Raises:
+        ValueError: For unknown parameters, values of the wrong type and
+                    numbers out of range.
+    """
+    options = copy.deepcopy(base_options)
+    options.setdefault("image_options", {})
+    for key, values in parse_qs(query, keep_blank_values=True).items():
+        value = values[-1]
+        if key in BOOL_OPTIONS or key in IMAGE_BOOL_OPTIONS:
+            if value.lower() not in _TRUE_VALUES | _FALSE_VALUES:
+                raise ValueError(f"'{key}' must be true or false")
+            target = options if key in BOOL_OPTIONS else options["image_options"]
+            target[key] = value.lower() in _TRUE_VALUES
+        elif key in IMAGE_INT_OPTIONS:
+            try:
+                number = int(value)
+            except ValueError:
+                raise ValueError(f"'{key}' must be an integer") from None
+            low, high = IMAGE_INT_OPTIONS[key]
+            if number < low or (high is not None and number > high):
+                expected = f"between {low} and {high}" if high else f"at least {low}"
+                raise ValueError(f"'{key}' must be {expected}")
+            options["image_options"][key] = number
+        else:
+            raise ValueError(f"Unknown option '{key}'")
+    return options
+
+
+class Metrics:
+    """Thread-safe counters exposed in Prometheus text format on /metrics."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.in_flight = 0
+
+    def add(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def adjust_in_flight(self, delta):
+        with self.lock:
+            self.in_flight += delta
+
+    def render(self):
+        with self.lock:
+            lines = [
+                f"epub_compressor_{name} {value}"
+                for name, value in sorted(self.counters.items())
+            ]
+            lines.append(f"epub_compressor_jobs_in_flight {self.in_flight}")
+        return "\n".join(lines) + "\n"
+
+
+class CompressionServer(ThreadingHTTPServer):
+    """
+    An HTTP front end to compress_epub_file. Each request thread streams its
+    upload to disk, hands the book to a shared process pool and streams the
+    result back. Requests beyond the pool size plus queue_limit are turned
+    away with 429 instead of piling up. If a worker crashes, the pool is
+    replaced and requests get 503 until the new one is running.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        options,
+        workers=None,
+        queue_limit=8,
+        max_upload=DEFAULT_MAX_UPLOAD,
+    ):
+        super().__init__(address, CompressionRequestHandler)
+        self.options = options
+        self.max_upload = max_upload
+        self.workers = workers or os.cpu_count() or 1
+        self.slots = threading.BoundedSemaphore(self.workers + queue_limit)
+        self.metrics = Metrics()
+        self.pool_lock = threading.Lock()
+        self.pool_ready = True
+        self.pool = self.new_pool()
+
+    def new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=watcher.warm_worker,
+            initargs=(self.options,),
+        )
+
+    def restart_pool(self, broken_pool):
+        """
+        Replaces a pool broken by a worker crash. Every request thread that
+        hit the crash calls this; only the first one replaces the pool.
+        """
+        with self.pool_lock:
+            if self.pool is not broken_pool:
+                return
+            self.pool_ready = False
+            self.metrics.add("pool_restarts_total")
+            broken_pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = self.new_pool()
+            # Workers start (and run warm_worker) on the first submit.
+            self.pool.submit(os.getpid).add_done_callback(self._pool_started)
+
+    def _pool_started(self, future):
+        if future.exception() is None:
+            self.pool_ready = True
+        else:
+            timer = threading.Timer(
+                POOL_RETRY_DELAY, self.restart_pool, args=(self.pool,)
+            )
+            timer.daemon = True
+            timer.start()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class CompressionRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "EpubCompressor"
+
+    # --- Responses ---
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        # Counted before the body goes out, so a client that reads /metrics
+        # right after this response already sees it.
+        self.server.metrics.add(f'responses_total{{code="{int(status)}"}}')
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message, headers=None):
+        # The request body may be unread, so the connection cannot be reused.
+        self.close_connection = True
+        self.send_json(status, {"error": message}, headers)
+
+    # --- Routes ---
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            ready = self.server.pool_ready
+            self.send_json(
+                HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE,
+                {
+                    "status": "ok" if ready else "unavailable",
+                    "pool": "ready" if ready else "restarting",
+                    "workers": self.server.workers,
+                },
+            )
+        elif path == "/metrics":
+            body = self.server.metrics.render().encode("utf-8")
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, "Not found")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/compress":
+            self.send_error_json(HTTPStatus.NOT_FOUND, "Not found")
+            return
+
+        try:
+            options = options_from_query(self.server.options, url.query)
+        except ValueError as e:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(e))
+            return
+
+        chunked = "chunked" in self.headers.get("Transfer-Encoding", "").lower()
+        length = self.headers.get("Content-Length")
+        if not chunked:
+            if length is None or not length.isdigit():
+                self.send_error_json(
+                    HTTPStatus.LENGTH_REQUIRED, "Content-Length is required"
+                )
+                return
+            if int(length) > self.server.max_upload:
+                self.send_error_json(
+                    HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Upload is too large"
+                )
+                return
+
+        if not self.server.pool_ready:
+            self.send_error_json(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                "Worker pool is restarting, try again shortly",
+                {"Retry-After": "1"},
+            )
+            return
+
+        if not self.server.slots.acquire(blocking=False):
+            self.server.metrics.add("rejected_total")
+            self.send_error_json(
+                HTTPStatus.TOO_MANY_REQUESTS,
+                "Server is busy, try again shortly",
+                {"Retry-After": "1"},
+            )
+            return
+
+        with tempfile.TemporaryDirectory(prefix="epub-compressor-") as tmp:
+            # The slot covers the upload and the job; streaming the result
+            # back does not hold a worker, so it happens after release.
+            self.server.metrics.adjust_in_flight(1)
+            try:
+                result = self.compress_upload(tmp, options, chunked, length)
+            finally:
+                self.server.metrics.adjust_in_flight(-1)
+                self.server.slots.release()
+            if result:
+                self.send_result(*result)
+
+    # --- Job Handling ---
+
+    def compress_upload(self, tmp, options, chunked, length):
+        """
+        Receives the upload and compresses it. Returns (output_path, stats),
+        or None after sending an error response.
+        """
+        input_path = os.path.join(tmp, "input.epub")
+        output_path = os.path.join(tmp, "output.epub")
+
+        with open(input_path, "wb") as f:
+            try:
+                if chunked:
+                    received = self.read_chunked(f)
+                else:
+                    received = self.read_exactly(f, int(length))
+            except ValueError as e:
+                self.send_error_json(HTTPStatus.BAD_REQUEST, str(e))
+                return None
+        self.server.metrics.add("bytes_received_total", received)
+
+        # Books are the unit of parallelism, so each runs its stages inline.
+        job_options = dict(options, workers=1)
+        started = time.monotonic()
+        pool = self.server.pool
+        try:
+            stats = pool.submit(
+                watcher.run_job, input_path, output_path, job_options
+            ).result()
+        except BrokenProcessPool:
+            self.server.metrics.add("jobs_failed_total")
+            self.server.restart_pool(pool)
+            self.send_error_json(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                "A worker process died, try again shortly",
+                {"Retry-After": "1"},
+            )
+            return None
+        except Exception as e:
+            self.server.metrics.add("jobs_failed_total")
+            self.send_error_json(HTTPStatus.UNPROCESSABLE_ENTITY, str(e))
+            return None
+        finally:
+            self.server.metrics.add("job_seconds_total", time.monotonic() - started)
+        self.server.metrics.add("jobs_completed_total")
+        return output_path, stats
+
+    def send_result(self, output_path, stats):
+        size = os.path.getsize(output_path)
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/epub+zip")
+        self.send_header("Content-Length", str(size))
+        self.send_header("X-Original-Size", str(stats["original_size"]))
+        self.send_header("X-Final-Size", str(stats["final_size"]))
+        self.send_header("X-Reduction-Percent", f"{stats['reduction_percent']:.1f}")
+        self.send_header("X-Validation-Problems", str(len(stats.get("problems") or [])))
+        self.end_headers()
+        self.server.metrics.add('responses_total{code="200"}')
+        self.server.metrics.add("bytes_sent_total", size)
+        with open(output_path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def read_exactly(self, out, length):
+        remaining = length
+        while remaining:
+            chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ValueError("Upload ended early")
+            out.write(chunk)
+            remaining -= len(chunk)
+        return length
+
+    def read_chunked(self, out):
+        received = 0
+        while True:
+            size_line = self.rfile.readline(1024).split(b";")[0].strip()
+            try:
+                size = int(size_line, 16)
+            except ValueError:
+                raise ValueError("Malformed chunked upload") from None
+            if size == 0:
+                # Skip trailers up to the blank line ending the body.
+                while self.rfile.readline(1024).strip():
+                    pass
+                return received
+            received += size
+            if received > self.server.max_upload:
+                raise ValueError("Upload is too large")
+            self.read_exactly(out, size)
+            self.rfile.readline(1024)  # CRLF after each chunk
+
+
+def run_server(
+    host,
+    port,
+    options,
+    workers=None,
+    queue_limit=8,
+    max_upload=DEFAULT_MAX_UPLOAD,
+    log_callback=print,
+):
+    """
+    Serves the compression engine over HTTP until interrupted.
+
+    Endpoints:
+        POST /compress  Body is the EPUB; the response body is the result.
+                        Query parameters override options, e.g.
+                        ?quality=60&strip_fonts=true
+        GET /health     Liveness check; 503 while the worker pool restarts.
+        GET /metrics    Counters in Prometheus text format.
+    """
+    server = CompressionServer((host, port), options, workers, queue_limit, max_upload)
+
+    def request_stop(signum, frame):
+        # shutdown() waits for serve_forever(), so it must not run on this thread.
+        threading.Thread(target=server.shutdown).start()
+
+    previous_handler = signal.signal(signal.SIGTERM, request_stop)
+    log_callback(
+        f"Serving on http://{host}:{server.server_address[1]} "
+        f"with {server.workers} worker(s)"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log_callback("Shutting down.")
+        server.server_close()
+        signal.signal(signal.SIGTERM, previous_handler)
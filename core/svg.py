@@ -0,0 +1,194 @@
+# core/svg.py
+import re
+
+from . import document
+
+# Namespace URIs written by drawing tools that renderers never read.
+EDITOR_NAMESPACE_MARKERS = (
+    "inkscape.org",
+    "sodipodi",
+    "bohemiancoding.com/sketch",
+    "serif.com",
+    "ns.adobe.com",
+)
+
+# Elements that only carry editor or licensing data.
+METADATA_ELEMENTS = {"metadata"}
+
+# Elements whose text content is rendered or otherwise significant.
+TEXT_ELEMENTS = {"text", "tspan", "textpath", "title", "desc", "style", "script"}
+
+# Attributes whose values are numbers or lists of numbers.
+NUMERIC_ATTRIBUTES = {
+    "d",
+    "points",
+    "transform",
+    "viewBox",
+    "x",
+    "y",
+    "x1",
+    "y1",
+    "x2",
+    "y2",
+    "cx",
+    "cy",
+    "r",
+    "rx",
+    "ry",
+    "width",
+    "height",
+    "stroke-width",
+}
+
+_NUMBER_PATTERN = re.compile(r"-?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?")
+
+
+def _prefix(name):
+    prefix, _, _ = name.rpartition(":")
+    return prefix
+
+
+def strip_editor_transform(events, context):
+    """Removes comments, <metadata> and anything in an editor namespace."""
+    editor_prefixes = set()
+    skip_depth = 0
+
+    for event in events:
+        kind = event[0]
+
+        if kind == "comment":
+            continue
+
+        if skip_depth:
+            if kind == "start" and not event[3]:
+                skip_depth += 1
+            elif kind == "end":
+                skip_depth -= 1
+            continue
+
+        if kind == "start":
+            _, name, attrs, self_closing = event
+            for attr, value in attrs:
+                if attr.startswith("xmlns:") and any(
+                    marker in (value or "") for marker in EDITOR_NAMESPACE_MARKERS
+                ):
+                    editor_prefixes.add(attr[len("xmlns:") :])
+
+            if (
+                _prefix(name) in editor_prefixes
+                or document.local_name(name) in METADATA_ELEMENTS
+            ):
+                if not self_closing:
+                    skip_depth = 1
+                continue
+
+            attrs = [
+                [attr, value]
+                for attr, value in attrs
+                if _prefix(attr) not in editor_prefixes
+                and not (
+                    attr.startswith("xmlns:")
+                    and attr[len("xmlns:") :] in editor_prefixes
+                )
+            ]
+            event = ("start", name, attrs, self_closing)
+
+        yield event
+
+
+def round_numbers_transform(events, context):
+    """Rounds coordinates and lengths to context['precision'] decimals."""
+    precision = context.get("precision", 3)
+
+    def round_number(match):
+        text = match.group(0)
+        if "." not in text or "e" in text.lower():
+            return text
+        if len(text.partition(".")[2]) <= precision:
+            return text
+        rounded = f"{float(text):.{precision}f}".rstrip("0").rstrip(".")
+        return "0" if rounded == "-0" else rounded
+
+    for event in events:
+        if event[0] == "start":
+            for attr in event[2]:
+                if attr[0] in NUMERIC_ATTRIBUTES and attr[1]:
+                    attr[1] = _NUMBER_PATTERN.sub(round_number, attr[1])
+        yield event
+
+
+def collapse_groups_transform(events, context):
+    """
+    Unwraps <g> elements without attributes and drops empty <g/>. A <g>
+    directly inside <switch> is one of its alternatives and always stays.
+    """
+    open_elements = []  # (local name, unwrapped) for each open element
+
+    for event in events:
+        kind = event[0]
+        if kind == "start":
+            name = document.local_name(event[1])
+            parent = open_elements[-1][0] if open_elements else None
+            unwrap = name == "g" and not event[2] and parent != "switch"
+            if not event[3]:
+                open_elements.append((name, unwrap))
+            if unwrap:
+                continue
+        elif kind == "end":
+            name = document.local_name(event[1])
+            if open_elements and open_elements[-1][0] == name:
+                if open_elements.pop()[1]:
+                    continue
+        yield event
+
+
+def minify_transform(events, context):
+    """Drops whitespace-only text outside elements where text is content."""
+    text_depth = 0
+
+    for event in events:
+        kind = event[0]
+        if kind in ("start", "end"):
+            if document.local_name(event[1]) in TEXT_ELEMENTS:
+                if kind == "start" and not event[3]:
+                    text_depth += 1
+                elif kind == "end" and text_depth:
+                    text_depth -= 1
+        elif kind == "text" and not text_depth and not event[1].strip():
+            continue
+        yield event
+
+
+document.register_transform("svg_strip_editor", strip_editor_transform)
+document.register_transform("svg_round_numbers", round_numbers_transform)
+document.register_transform("svg_collapse_groups", collapse_groups_transform)
+document.register_transform("svg_minify", minify_transform)
+
+SVG_TRANSFORMS = [
+    "svg_strip_editor",
+    "svg_round_numbers",
+    "svg_collapse_groups",
+    "svg_minify",
+]
+
+
+def optimize_svg(svg_bytes, options):
+    """
+    Optimizes an SVG image: strips editor metadata, rounds coordinates,
+    unwraps redundant groups and removes layout whitespace.
+
+    Args:
+        svg_bytes (bytes): The raw bytes of the SVG file.
+        options (dict): A dictionary with optimization settings.
+                        - 'precision' (int): Decimals to keep in coordinates.
+
+    Returns:
+        bytes: The optimized SVG bytes, or the original on failure.
+    """
+    optimized = document.process_document(
+        svg_bytes,
+        SVG_TRANSFORMS,
+        {"precision": options.get("precision", 3)},
+        repair=False,
+    )
+    return svg_bytes if optimized is None else optimized
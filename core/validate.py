@@ -0,0 +1,195 @@
+# core/validate.py
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote
+
+from . import document, probe
+
+# Checks a freshly written EPUB for the structural mistakes a compression run
+# can introduce. It reads the zip central directory, container.xml, the OPF
+# and a few header bytes per image; page content is never re-parsed. Links
+# come from a link index built from the item bytes before they were written.
+
+MIMETYPE = b"application/epub+zip"
+CONTAINER_PATH = "META-INF/container.xml"
+
+FORMAT_MEDIA_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+SNIFF_SIZE = 16
+
+OPF_NS = "{http://www.idpf.org/2007/opf}"
+CONTAINER_NS = "{urn:oasis:names:tc:opendocument:xmlns:container}"
+
+DOCUMENT_MEDIA_TYPES = {"application/xhtml+xml", "text/html", "image/svg+xml"}
+
+# Attribute values and url(...) tokens that point at other files. A scan, not
+# a parse: a link inside a comment is reported like any other.
+_ATTRIBUTE_LINK_PATTERN = re.compile(
+    rb"""(?<![\w:.-])(src|href|xlink:href|poster|data)\s*=\s*(?:"([^"]*)"|'([^']*)')""",
+    re.I,
+)
+_CSS_LINK_PATTERN = re.compile(rb"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+
+
+# --- Link Index ---
+
+
+def index_links(media_type, content):
+    """
+    Lists the links in one manifest item.
+
+    Args:
+        media_type (str): The item's media type.
+        content (bytes): The item's bytes as they will be written.
+
+    Returns:
+        list: The links as written (str), or an empty list for other types.
+    """
+    if media_type in DOCUMENT_MEDIA_TYPES:
+        links = [
+            match.group(2) if match.group(2) is not None else match.group(3)
+            for match in _ATTRIBUTE_LINK_PATTERN.finditer(content)
+        ]
+        # url(...) in style attributes and <style> elements
+        links.extend(match.group(2) for match in _CSS_LINK_PATTERN.finditer(content))
+    elif media_type == "text/css":
+        links = [match.group(2) for match in _CSS_LINK_PATTERN.finditer(content)]
+    else:
+        return []
+    return [link.decode("utf-8", "replace") for link in links if link]
+
+
+# --- Validation ---
+
+
+def validate_epub(path, link_index=None):
+    """
+    Runs the structural checks on a written EPUB.
+
+    Args:
+        path (str): The EPUB file.
+        link_index (dict): Maps manifest file names (relative to the OPF) to
+                           the links in them, from index_links(). Reference
+                           checks are skipped without it.
+
+    Returns:
+        list: A description of each problem found; empty if the book passed.
+    """
+    problems = []
+    try:
+        with zipfile.ZipFile(path) as zf:
+            infos = zf.infolist()
+            _check_mimetype(zf, infos, problems)
+
+            opf_path = _find_opf(zf, problems)
+            if opf_path is None:
+                return problems
+            manifest = _read_manifest(zf, opf_path, problems)
+            if manifest is None:
+                return problems
+
+            opf_dir = posixpath.dirname(opf_path)
+            zip_names = {info.filename for info in infos}
+            _check_manifest(zf, manifest, opf_dir, zip_names, problems)
+            _check_unlisted(manifest, opf_path, zip_names, problems)
+            if link_index:
+                _check_links(manifest, link_index, problems)
+    except (zipfile.BadZipFile, OSError) as e:
+        problems.append(f"Could not read the archive: {e}")
+    return problems
+
+
+def _check_mimetype(zf, infos, problems):
+    if not infos or infos[0].filename != "mimetype":
+        problems.append("'mimetype' is not the first entry in the archive")
+        if "mimetype" not in zf.namelist():
+            return
+    info = zf.getinfo("mimetype")
+    if info.compress_type != zipfile.ZIP_STORED:
+        problems.append("'mimetype' is compressed; it must be stored")
+    if zf.read(info).strip() != MIMETYPE:
+        problems.append(f"'mimetype' does not contain {MIMETYPE.decode()}")
+
+
+def _find_opf(zf, problems):
+    try:
+        root = ET.fromstring(zf.read(CONTAINER_PATH))
+    except KeyError:
+        problems.append(f"{CONTAINER_PATH} is missing")
+        return None
+    except ET.ParseError as e:
+        problems.append(f"{CONTAINER_PATH} is not well-formed: {e}")
+        return None
+
+    rootfile = root.find(f".//{CONTAINER_NS}rootfile")
+    if rootfile is None or not rootfile.get("full-path"):
+        problems.append(f"{CONTAINER_PATH} does not name a package document")
+        return None
+    return rootfile.get("full-path")
+
+
+def _read_manifest(zf, opf_path, problems):
+    """Returns {file name relative to the OPF: media type}, or None."""
+    try:
+        root = ET.fromstring(zf.read(opf_path))
+    except KeyError:
+        problems.append(f"Package document {opf_path} is missing")
+        return None
+    except ET.ParseError as e:
+        problems.append(f"Package document {opf_path} is not well-formed: {e}")
+        return None
+
+    manifest = {}
+    for item in root.iter(f"{OPF_NS}item"):
+        href = item.get("href")
+        if href:
+            manifest[posixpath.normpath(unquote(href))] = item.get("media-type", "")
+    return manifest
+
+
+def _check_manifest(zf, manifest, opf_dir, zip_names, problems):
+    """Every manifest item exists, and raster images are what they claim."""
+    for file_name, media_type in manifest.items():
+        zip_name = posixpath.join(opf_dir, file_name)
+        if zip_name not in zip_names:
+            problems.append(f"Manifest item {file_name} is missing from the archive")
+            continue
+        if media_type not in FORMAT_MEDIA_TYPES.values():
+            continue
+
+        with zf.open(zip_name) as f:
+            head = f.read(SNIFF_SIZE)
+        actual = FORMAT_MEDIA_TYPES.get(probe.sniff_image_format(head))
+        if actual != media_type:
+            problems.append(
+                f"{file_name} is declared as {media_type} but contains "
+                f"{actual or 'unrecognised data'}"
+            )
+
+
+def _check_unlisted(manifest, opf_path, zip_names, problems):
+    """Files in the archive that the manifest does not list."""
+    opf_dir = posixpath.dirname(opf_path)
+    listed = {posixpath.join(opf_dir, file_name) for file_name in manifest}
+    for zip_name in sorted(zip_names - listed):
+        if (
+            zip_name in ("mimetype", opf_path)
+            or zip_name.startswith("META-INF/")
+            or zip_name.endswith("/")
+        ):
+            continue
+        problems.append(f"{zip_name} is in the archive but not in the manifest")
+
+
+def _check_links(manifest, link_index, problems):
+    for file_name, links in link_index.items():
+        for link in links:
+            target = document.resolve_reference(file_name, link)
+            if target is not None and target not in manifest:
+                problems.append(f"{file_name} links to missing file {link}")
@@ -0,0 +1,415 @@
+# core/watcher.py
+import importlib
+import os
+import signal
+import sqlite3
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# --- Retry Policy ---
+
+MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 30  # Seconds before the first retry; doubles each time
+RETRY_MAX_DELAY = 30 * 60
+
+# --- Job Queue ---
+
+
+class JobQueue:
+    """
+    A durable FIFO of EPUB files to compress, stored in SQLite so queued and
+    failed jobs survive restarts. A file is identified by its path, size and
+    modification time, so replacing a file queues it again.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    input_path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL DEFAULT 0,
+                    output_path TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    UNIQUE (input_path, size, mtime_ns)
+                )
+                """)
+
+    def enqueue(self, input_path, size, mtime_ns):
+        """Adds a file unless this exact version was queued before. Returns True if added."""
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO jobs "
+                "(input_path, size, mtime_ns, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (input_path, size, mtime_ns, now, now),
+            )
+        return cursor.rowcount > 0
+
+    def claim(self):
+        """Marks the oldest due job as running and returns it, or None."""
+        now = time.time()
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND next_attempt <= ? "
+                "ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                "updated = ? WHERE id = ?",
+                (now, row["id"]),
+            )
+        return dict(row, attempts=row["attempts"] + 1)
+
+    def complete(self, job_id, output_path):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'done', output_path = ?, error = NULL, "
+                "updated = ? WHERE id = ?",
+                (output_path, time.time(), job_id),
+            )
+
+    def fail(self, job_id, attempts, error):
+        """
+        Records a failed attempt and schedules a retry with exponential
+        backoff, or gives up after MAX_ATTEMPTS. Returns True if it will retry.
+        """
+        now = time.time()
+        retry = attempts < MAX_ATTEMPTS
+        delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, next_attempt = ?, error = ?, updated = ? "
+                "WHERE id = ?",
+                (
+                    "queued" if retry else "failed",
+                    now + delay if retry else 0,
+                    error,
+                    now,
+                    job_id,
+                ),
+            )
+        return retry
+
+    def release(self, job_id):
+        """Returns a claimed job that never started to the queue, uncounted."""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), "
+                "updated = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+
+    def requeue_interrupted(self):
+        """
+        Puts jobs left 'running' by a crash or shutdown back in the queue.
+        The interrupted attempt did not fail, so it is not counted.
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), "
+                "updated = ? WHERE status = 'running'",
+                (time.time(),),
+            )
+        return cursor.rowcount
+
+    def counts(self):
+        """Returns the number of jobs in each status."""
+        rows = self.conn.execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ).fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+# --- Worker Side ---
+
+
+def warm_worker(options=None):
+    """
+    Process pool initializer: pays for ebooklib and the engines the enabled
+    stages need once per worker instead of once per book. Engines for stages
+    that are off are never imported.
+
+    It also resets the signal handlers inherited from the service: Ctrl+C
+    reaches the whole process group, and only the parent should act on it,
+    letting books in progress finish. SIGTERM gets its default action back.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    from ebooklib import epub  # noqa: F401
+
+    from . import epub_handler, pipeline  # noqa: F401
+
+    options = options or {}
+    modules = pipeline.required_modules(options)
+    if options.get("dedupe_pixels"):
+        modules.append("PIL.Image")
+    for name in modules:
+        importlib.import_module(name)
+    if "PIL.Image" in modules:
+        # Registers the codec plugins up front rather than on the first open.
+        importlib.import_module("PIL.Image").init()
+
+
+def run_job(input_path, output_path, options):
+    """
+    Compresses one book inside a worker. The result is written next to its
+    destination and renamed into place, so readers of the output folder
+    never see a partial file.
+    """
+    from .epub_handler import compress_epub_file
+
+    name = os.path.basename(input_path)
+    partial_path = os.path.join(
+        os.path.dirname(output_path),
+        f".{os.path.basename(output_path)}.{os.getpid()}.partial",
+    )
+    try:
+        stats = compress_epub_file(
+            input_path,
+            partial_path,
+            options,
+            log_callback=lambda message: print(f"[{name}] {message}", flush=True),
+            progress_callback=lambda value, message: None,
+        )
+        os.replace(partial_path, output_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return stats
+
+
+# --- Service Loop ---
+
+
+def _scan(input_dirs, seen, queue, log_callback):
+    """
+    Queues EPUBs that have stopped changing since the previous scan, so
+    files still being copied in are not picked up half-written.
+    """
+    current = {}
+    for input_dir in input_dirs:
+        with os.scandir(input_dir) as entries:
+            for entry in entries:
+                if (
+                    entry.name.startswith(".")
+                    or not entry.name.lower().endswith(".epub")
+                    or not entry.is_file()
+                ):
+                    continue
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime_ns)
+                current[entry.path] = signature
+                if seen.get(entry.path) == signature and queue.enqueue(
+                    entry.path, *signature
+                ):
+                    log_callback(f"Queued {entry.path}")
+    return current
+
+
+def _finish(job, future, output_path, queue, processed_dir, failed_dir, log_callback):
+    """Records a finished attempt in the queue and files the input away."""
+    input_path = job["input_path"]
+    try:
+        stats = future.result()
+    except Exception as e:
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        if queue.fail(job["id"], job["attempts"], error):
+            log_callback(
+                f"Attempt {job['attempts']} failed for {input_path}: {error} (will retry)"
+            )
+        else:
+            log_callback(f"Giving up on {input_path}: {error}")
+            _move_into(input_path, failed_dir)
+        return
+
+    queue.complete(job["id"], output_path)
+    problems = stats.get("problems") or []
+    log_callback(
+        f"Finished {input_path} -> {output_path} "
+        f"({stats['reduction_percent']:.1f}% saved"
+        + (f", {len(problems)} validation problem(s))" if problems else ")")
+    )
+    _move_into(input_path, processed_dir)
+
+
+def _move_into(path, directory):
+    if directory and os.path.exists(path):
+        os.replace(path, os.path.join(directory, os.path.basename(path)))
+
+
+def run_watch_service(
+    input_dirs,
+    output_dir,
+    options,
+    queue_path,
+    workers=None,
+    poll_interval=2.0,
+    processed_dir=None,
+    failed_dir=None,
+    log_callback=print,
+):
+    """
+    Watches input folders and compresses every EPUB dropped into them until
+    interrupted (Ctrl+C or SIGTERM).
+
+    Args:
+        input_dirs (list): Folders to poll for new .epub files.
+        output_dir (str): Folder that receives '<name>_compressed.epub'.
+        options (dict): Compression options, as for compress_epub_file.
+        queue_path (str): SQLite file holding the job queue.
+        workers (int): Books compressed in parallel (default: CPU count).
+        poll_interval (float): Seconds between folder scans.
+        processed_dir (str): If set, inputs are moved here once compressed.
+        failed_dir (str): If set, inputs are moved here after the last retry.
+        log_callback (callable): Receives progress messages.
+    """
+    input_dirs = [os.path.abspath(path) for path in input_dirs]
+    if os.path.abspath(output_dir) in input_dirs:
+        raise ValueError("The output folder must not be one of the watched folders")
+    for directory in (output_dir, processed_dir, failed_dir):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    # Books are the unit of parallelism here, so each runs its stages inline.
+    job_options = dict(options, workers=1)
+
+    queue = JobQueue(queue_path)
+    requeued = queue.requeue_interrupted()
+    if requeued:
+        log_callback(f"Requeued {requeued} interrupted job(s)")
+
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    previous_handlers = {
+        signum: signal.signal(signum, request_stop)
+        for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+    log_callback(
+        f"Watching {', '.join(input_dirs)} with {workers} worker(s); "
+        f"writing to {output_dir}"
+    )
+
+    def new_pool():
+        return ProcessPoolExecutor(
+            max_workers=workers, initializer=warm_worker, initargs=(job_options,)
+        )
+
+    seen = {}
+    in_flight = {}
+    suspects = set()  # Job ids caught in a crash that hit several books
+    pool = new_pool()
+    try:
+        while not stopping:
+            seen = _scan(input_dirs, seen, queue, log_callback)
+            broken = False
+
+            # Suspects run one at a time so a crash can be pinned on one book.
+            while len(in_flight) < (1 if suspects else workers):
+                job = queue.claim()
+                if job is None:
+                    break
+                name, ext = os.path.splitext(os.path.basename(job["input_path"]))
+                output_path = os.path.join(output_dir, f"{name}_compressed{ext}")
+                try:
+                    future = pool.submit(
+                        run_job, job["input_path"], output_path, job_options
+                    )
+                except BrokenProcessPool:
+                    queue.release(job["id"])
+                    broken = True
+                    break
+                log_callback(
+                    f"Starting {job['input_path']} (attempt {job['attempts']})"
+                )
+                in_flight[future] = (job, output_path)
+
+            if in_flight:
+                done, _ = wait(
+                    in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED
+                )
+            else:
+                done = set()
+                if not broken:
+                    time.sleep(poll_interval)
+
+            if broken or any(
+                isinstance(future.exception(), BrokenProcessPool) for future in done
+            ):
+                # A worker died (segfault, OOM kill) and took the pool with it,
+                # failing every job still in it. Only a book that was running
+                # alone is known to be the culprit and uses up an attempt; the
+                # rest go back uncounted and are rerun alone, so a book that
+                # keeps crashing is still given up on.
+                log_callback("A worker process died; restarting the worker pool.")
+                done, _ = wait(in_flight)
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool()
+                crashed = [
+                    future
+                    for future in done
+                    if isinstance(future.exception(), BrokenProcessPool)
+                ]
+                if len(crashed) > 1:
+                    for future in crashed:
+                        job, _ = in_flight.pop(future)
+                        done.discard(future)
+                        queue.release(job["id"])
+                        suspects.add(job["id"])
+                    log_callback(
+                        f"Rerunning {len(crashed)} book(s) one at a time "
+                        "to find the one that crashed"
+                    )
+
+            for future in done:
+                job, output_path = in_flight.pop(future)
+                suspects.discard(job["id"])
+                _finish(
+                    job,
+                    future,
+                    output_path,
+                    queue,
+                    processed_dir,
+                    failed_dir,
+                    log_callback,
+                )
+    finally:
+        log_callback("Stopping; unfinished jobs will resume on the next start.")
+        pool.shutdown(wait=True, cancel_futures=True)
+        for future, (job, output_path) in in_flight.items():
+            if future.done() and not future.cancelled():
+                _finish(
+                    job,
+                    future,
+                    output_path,
+                    queue,
+                    processed_dir,
+                    failed_dir,
+                    log_callback,
+                )
+        queue.requeue_interrupted()
+        queue.close()
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
@@ -1,9 +1,170 @@
 # main.py
+import argparse
+import copy
+import os
+import subprocess
 import sys
-from PyQt6.QtWidgets import QApplication
-from ui.main_window import MainWindow
 
-if __name__ == "__main__":
+# Entry points timed by --benchmark-imports, and the third-party engines
+# none of them may load at import time. Engines are imported by the stages
+# that use them (see core.pipeline), so startup only pays for what runs.
+STARTUP_MODULES = (
+    "core.epub_handler",
+    "core.watcher",
+    "core.server",
+    "ui.main_window",
+)
+LAZY_ENGINES = ("PIL", "htmlmin", "cssmin", "jsmin", "bs4", "lxml", "ebooklib.epub")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Compress EPUB files. Starts the GUI unless a service mode is chosen."
+    )
+    service = parser.add_argument_group("watch-folder service")
+    service.add_argument(
+        "--watch",
+        metavar="DIR",
+        action="append",
+        help="Folder to watch for new EPUBs (repeatable). Runs without the GUI.",
+    )
+    service.add_argument("--output", metavar="DIR", help="Folder for compressed books")
+    service.add_argument(
+        "--queue",
+        metavar="FILE",
+        help="SQLite job queue (default: <output>/.epub-compressor-queue.sqlite3)",
+    )
+    service.add_argument(
+        "--workers", type=int, help="Books compressed in parallel (default: CPU count)"
+    )
+    service.add_argument(
+        "--poll", type=float, default=2.0, help="Seconds between folder scans"
+    )
+    service.add_argument(
+        "--processed-dir", metavar="DIR", help="Move inputs here when done"
+    )
+    service.add_argument(
+        "--failed-dir", metavar="DIR", help="Move inputs here after the last retry"
+    )
+
+    server = parser.add_argument_group("HTTP service")
+    server.add_argument(
+        "--serve",
+        metavar="[HOST:]PORT",
+        help="Serve POST /compress, /health and /metrics. Runs without the GUI.",
+    )
+    server.add_argument(
+        "--queue-limit",
+        type=int,
+        default=8,
+        help="Uploads allowed to wait for a worker before answering 429",
+    )
+    server.add_argument(
+        "--max-upload-mb", type=int, default=512, help="Largest accepted upload"
+    )
+
+    parser.add_argument(
+        "--benchmark-imports",
+        action="store_true",
+        help="Time the startup imports and fail if an engine loads eagerly",
+    )
+
+    settings = parser.add_argument_group("compression settings")
+    settings.add_argument("--quality", type=int, help="Image quality (10-95)")
+    settings.add_argument(
+        "--strip-fonts", action="store_true", help="Remove embedded fonts"
+    )
+    return parser.parse_args(argv)
+
+
+def build_options(args):
+    """Starts from the GUI defaults and applies the command-line settings."""
+    from core.epub_handler import DEFAULT_OPTIONS
+
+    options = copy.deepcopy(DEFAULT_OPTIONS)
+    if args.quality is not None:
+        options["image_options"]["quality"] = args.quality
+    if args.strip_fonts:
+        options["strip_fonts"] = True
+    return options
+
+
+def run_watch_service(args):
+    from core.watcher import run_watch_service
+
+    if not args.output:
+        sys.exit("--watch requires --output")
+    run_watch_service(
+        args.watch,
+        args.output,
+        build_options(args),
+        queue_path=args.queue
+        or os.path.join(args.output, ".epub-compressor-queue.sqlite3"),
+        workers=args.workers,
+        poll_interval=args.poll,
+        processed_dir=args.processed_dir,
+        failed_dir=args.failed_dir,
+    )
+
+
+def run_server(args):
+    from core.server import run_server
+
+    host, _, port = args.serve.rpartition(":")
+    if not port.isdigit():
+        sys.exit("--serve expects [HOST:]PORT")
+    run_server(
+        host or "127.0.0.1",
+        int(port),
+        build_options(args),
+        workers=args.workers,
+        queue_limit=args.queue_limit,
+        max_upload=args.max_upload_mb * 1024 * 1024,
+    )
+
+
+def benchmark_imports():
+    """
+    Imports each entry point in a fresh interpreter under -X importtime and
+    reports its cumulative import time. Exits non-zero if any of them pulls
+    in one of LAZY_ENGINES.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    check = (
+        "import sys; "
+        f"print(','.join(e for e in {LAZY_ENGINES!r} if e in sys.modules))"
+    )
+    leaks = False
+    for module in STARTUP_MODULES:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}; {check}"],
+            cwd=root,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            print(f"{module:<20} failed to import")
+            leaks = True
+            continue
+
+        micros = 0
+        for line in result.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == module:
+                micros = int(fields[1])
+        loaded = result.stdout.strip()
+        print(
+            f"{module:<20} {micros / 1000:8.1f} ms"
+            + (f"  eagerly loads: {loaded}" if loaded else "")
+        )
+        leaks = leaks or bool(loaded)
+    sys.exit(1 if leaks else 0)
+
+
+def run_gui():
+    from PyQt6.QtWidgets import QApplication
+    from ui.main_window import MainWindow
+
     # Create the application instance
     app = QApplication(sys.argv)
 
@@ -13,3 +174,15 @@ if __name__ == "__main__":
 
     # Start the event loop
     sys.exit(app.exec())
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.benchmark_imports:
+        benchmark_imports()
+    elif args.watch:
+        run_watch_service(args)
+    elif args.serve:
+        run_server(args)
+    else:
+        run_gui()
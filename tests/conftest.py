@@ -0,0 +1,56 @@
+# tests/conftest.py
+import io
+
+import pytest
+from ebooklib import epub
+from PIL import Image
+
+
+def png_bytes(color, size=(32, 32)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def page(body, head=""):
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml">'
+        f"<head><title>t</title>{head}</head><body>{body}</body></html>"
+    ).encode("utf-8")
+
+
+@pytest.fixture
+def make_epub(tmp_path):
+    """
+    Writes a small EPUB and returns its path. Takes (file_name, media_type,
+    content) tuples; XHTML items go in the spine.
+    """
+
+    def build(items, name="book.epub"):
+        book = epub.EpubBook()
+        book.set_identifier("test-book")
+        book.set_title("Test")
+        book.set_language("en")
+        spine = []
+        for index, (file_name, media_type, content) in enumerate(items):
+            # Plain EpubItems are written byte for byte; EpubHtml would
+            # rebuild each page's <head> and drop its stylesheet links.
+            item = epub.EpubItem(
+                uid=f"item{index}",
+                file_name=file_name,
+                media_type=media_type,
+                content=content,
+            )
+            if media_type == "application/xhtml+xml":
+                spine.append(item)
+            book.add_item(item)
+        book.toc = []
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+        book.spine = ["nav"] + spine
+        path = tmp_path / name
+        epub.write_epub(str(path), book, {})
+        return str(path)
+
+    return build
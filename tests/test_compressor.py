@@ -0,0 +1,75 @@
+# tests/test_compressor.py
+import base64
+import io
+import os
+
+from PIL import Image
+
+from core import compressor, document
+
+IMAGE_OPTIONS = {"quality": 60, "max_width": 1200, "max_height": 1600}
+
+CSS = b"p{margin:0}@font-face{font-family:X;src:url(../fonts/x.ttf)}h1{color:red}"
+
+
+def test_strip_font_rules_removes_font_face():
+    assert compressor.strip_font_rules_from_css(CSS) == b"p{margin:0}h1{color:red}"
+
+
+def test_strip_font_rules_accepts_memoryview():
+    stripped = compressor.strip_font_rules_from_css(memoryview(CSS))
+    assert bytes(stripped) == b"p{margin:0}h1{color:red}"
+
+
+def test_strip_font_rules_returns_input_without_fonts():
+    css = memoryview(b"p{margin:0}")
+    assert compressor.strip_font_rules_from_css(css) is css
+
+
+# --- Inline Images ---
+
+
+def noisy_png_uri(size=(200, 150)):
+    image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def decode_uri(uri):
+    header, _, data = uri.partition(",")
+    return header, Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+def test_compress_data_uri_reembeds_smaller_image():
+    uri = noisy_png_uri()
+    compressed = compressor.compress_data_uri(uri, IMAGE_OPTIONS)
+    assert len(compressed) < len(uri)
+    header, image = decode_uri(compressed)
+    assert header == "data:image/jpeg;base64"
+    assert image.format == "JPEG" and image.size == (200, 150)
+
+
+def test_compress_data_uri_keeps_undecodable_uri():
+    uri = "data:image/png;base64,not-base64!"
+    assert compressor.compress_data_uri(uri, IMAGE_OPTIONS) == uri
+
+
+def test_compress_data_uris_keeps_surrounding_text():
+    uri = noisy_png_uri()
+    css = f"p{{margin:0}}.a{{background:url({uri})}}h1{{color:red}}"
+    compressed = compressor.compress_data_uris(css, IMAGE_OPTIONS)
+    before, _, rest = compressed.partition("url(")
+    new_uri, _, after = rest.partition(")")
+    assert (before, after) == ("p{margin:0}.a{background:", "}h1{color:red}")
+    assert decode_uri(new_uri)[1].format == "JPEG"
+
+
+def test_inline_images_transform_recompresses_attributes():
+    uri = noisy_png_uri()
+    markup = f'<p><img alt="x" src="{uri}"/></p>'.encode("utf-8")
+    result = document.process_document(
+        markup, ["inline_images"], {"image_options": IMAGE_OPTIONS}
+    ).decode("utf-8")
+    assert result.startswith('<p><img alt="x" src="data:image/jpeg;base64,')
+    assert result.endswith('"/></p>') and len(result) < len(markup)
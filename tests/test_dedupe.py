@@ -0,0 +1,52 @@
+# tests/test_dedupe.py
+import io
+
+from PIL import Image, ImageDraw, ImageFont
+
+from core import dedupe
+
+from .conftest import png_bytes
+
+
+def caption(text, image_format="PNG", **save_options):
+    image = Image.new("RGB", (600, 200), "white")
+    font = ImageFont.load_default(size=48)
+    ImageDraw.Draw(image).text((40, 70), text, fill="black", font=font)
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **save_options)
+    return buffer.getvalue()
+
+
+def test_identical_bytes_are_merged():
+    content = png_bytes("red")
+    entries = [
+        ("a.png", "image/png", content),
+        ("b.png", "image/png", content),
+    ]
+    assert dedupe.find_duplicates(entries) == {"b.png": "a.png"}
+
+
+def test_kept_file_survives():
+    content = png_bytes("red")
+    entries = [
+        ("a.png", "image/png", content),
+        ("cover.png", "image/png", content),
+    ]
+    assert dedupe.find_duplicates(entries, keep={"cover.png"}) == {"a.png": "cover.png"}
+
+
+def test_reencoded_image_is_merged():
+    entries = [
+        ("a.png", "image/png", caption("Chapter 1")),
+        ("b.jpg", "image/jpeg", caption("Chapter 1", "JPEG", quality=95)),
+    ]
+    # The smaller encoding is the one kept.
+    assert dedupe.find_duplicates(entries, compare_pixels=True) == {"a.png": "b.jpg"}
+
+
+def test_images_differing_in_one_digit_are_kept():
+    entries = [
+        ("a.png", "image/png", caption("Chapter 1")),
+        ("b.png", "image/png", caption("Chapter 2")),
+    ]
+    assert dedupe.find_duplicates(entries, compare_pixels=True) == {}
@@ -0,0 +1,91 @@
+# tests/test_document.py
+import pytest
+
+from core import document
+
+
+def minify(markup):
+    return document.process_document(markup.encode("utf-8"), ["minify"]).decode("utf-8")
+
+
+# --- Tokenizer ---
+
+
+def test_parse_events():
+    events = list(document.parse('<p class="a" hidden>Hi<br/></p><!-- c -->'))
+    assert events == [
+        ("start", "p", [["class", "a"], ["hidden", None]], False),
+        ("text", "Hi"),
+        ("start", "br", [], True),
+        ("end", "p"),
+        ("comment", "<!-- c -->"),
+    ]
+
+
+def test_parse_keeps_raw_text_elements_whole():
+    events = list(document.parse("<script>if (a < b) { x(); }</script>"))
+    assert events == [
+        ("start", "script", [], False),
+        ("text", "if (a < b) { x(); }"),
+        ("end", "script"),
+    ]
+
+
+def test_parse_rejects_stray_angle_bracket():
+    with pytest.raises(ValueError):
+        list(document.parse("<p>a < b</p>"))
+
+
+def test_serialize_round_trips():
+    markup = (
+        "<?xml version='1.0' encoding='utf-8'?>\n<!DOCTYPE html>\n"
+        '<html xmlns="http://www.w3.org/1999/xhtml"><body>'
+        '<p title="x &amp; y">A&#160;B<![CDATA[raw]]></p></body></html>'
+    )
+    assert document.serialize(document.parse(markup)) == markup
+
+
+# --- Minifier ---
+
+
+def test_minify_keeps_nbsp_spacer_paragraph():
+    assert minify("<p>\u00a0</p>") == "<p>\u00a0</p>"
+
+
+def test_minify_keeps_leading_nbsp_indent():
+    markup = "<p>\u00a0\u00a0\u00a0Indented verse</p>"
+    assert minify(markup) == markup
+
+
+def test_minify_keeps_unicode_spaces():
+    assert minify("<p>A\u3000B\u2009C</p>") == "<p>A\u3000B\u2009C</p>"
+
+
+def test_minify_collapses_xml_whitespace():
+    assert minify("<div>\n  <p>  Some \t\n text  </p>\n</div>") == (
+        "<div><p>Some text </p></div>"
+    )
+
+
+def test_minify_keeps_space_between_inline_elements():
+    assert minify("<p><b>bold</b>\n  <i>italic</i></p>") == (
+        "<p><b>bold</b> <i>italic</i></p>"
+    )
+
+
+def test_minify_leaves_pre_and_script_alone():
+    markup = "<pre>  a\n    b  </pre><script>\n  var x  =  1;\n</script>"
+    assert minify(markup) == markup
+
+
+def test_minify_drops_comments():
+    assert minify("<p>a<!-- note -->b</p>") == "<p>ab</p>"
+
+
+def test_process_document_repairs_stray_angle_bracket():
+    result = document.process_document(b"<p>a < b</p>", ["minify"])
+    assert result == b"<p>a &lt; b</p>"
+
+
+def test_process_document_without_repair_gives_none():
+    assert document.process_document(b"<p>a < b</p>", ["minify"], repair=False) is None
@@ -0,0 +1,138 @@
+# tests/test_epub_handler.py
+import zipfile
+
+from core.epub_handler import DEFAULT_OPTIONS, compress_epub_file
+
+from .conftest import page, png_bytes
+
+
+def compress(input_path, output_path, **overrides):
+    log = []
+    stats = compress_epub_file(
+        input_path,
+        output_path,
+        dict(DEFAULT_OPTIONS, workers=1, **overrides),
+        log_callback=log.append,
+        progress_callback=lambda value, message: None,
+    )
+    return stats, log
+
+
+def test_duplicate_is_merged_when_every_link_is_rewritten(make_epub, tmp_path):
+    image = png_bytes("red")
+    path = make_epub(
+        [
+            ("images/a.png", "image/png", image),
+            ("images/b.png", "image/png", image),
+            (
+                "text/c1.xhtml",
+                "application/xhtml+xml",
+                page('<img src="../images/a.png"/><img src="../images/b.png"/>'),
+            ),
+        ]
+    )
+    output = str(tmp_path / "out.epub")
+    stats, log = compress(path, output, compress_images=False)
+
+    names = zipfile.ZipFile(output).namelist()
+    assert "EPUB/images/b.png" not in names
+    assert b"b.png" not in zipfile.ZipFile(output).read("EPUB/text/c1.xhtml")
+    assert stats["problems"] == []
+
+
+def test_duplicate_linked_from_svg_is_kept(make_epub, tmp_path):
+    image = png_bytes("blue")
+    svg = (
+        b'<svg xmlns="http://www.w3.org/2000/svg" '
+        b'xmlns:xlink="http://www.w3.org/1999/xlink" width="10" height="10">'
+        b'<image xlink:href="b.png" width="10" height="10"/></svg>'
+    )
+    path = make_epub(
+        [
+            ("images/a.png", "image/png", image),
+            ("images/b.png", "image/png", image),
+            ("images/fig.svg", "image/svg+xml", svg),
+            (
+                "text/c1.xhtml",
+                "application/xhtml+xml",
+                page('<img src="../images/a.png"/><img src="../images/fig.svg"/>'),
+            ),
+        ]
+    )
+    output = str(tmp_path / "out.epub")
+    stats, log = compress(path, output)
+
+    assert "EPUB/images/b.png" in zipfile.ZipFile(output).namelist()
+    assert any("Kept duplicate images/b.png" in line for line in log)
+    assert stats["problems"] == []
+
+
+def test_duplicate_linked_from_inline_css_is_merged(make_epub, tmp_path):
+    image = png_bytes("green")
+    body = (
+        "<div style=\"background-image:url('../images/b.png')\">x</div>"
+        '<img src="../images/a.png"/>'
+    )
+    style = "<style>p { background: url(../images/b.png) }</style>"
+    path = make_epub(
+        [
+            ("images/a.png", "image/png", image),
+            ("images/b.png", "image/png", image),
+            ("text/c1.xhtml", "application/xhtml+xml", page(body, head=style)),
+        ]
+    )
+    output = str(tmp_path / "out.epub")
+    stats, log = compress(path, output, compress_images=False)
+
+    archive = zipfile.ZipFile(output)
+    written = archive.read("EPUB/text/c1.xhtml")
+    assert "EPUB/images/b.png" not in archive.namelist()
+    assert b"b.png" not in written
+    assert written.count(b"../images/a.png") == 3
+    assert stats["problems"] == []
+
+
+def test_duplicate_linked_from_svg_style_is_kept(make_epub, tmp_path):
+    image = png_bytes("yellow")
+    svg = (
+        b'<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10">'
+        b"<style>.bg { fill: url(b.png) }</style>"
+        b'<rect class="bg" width="10" height="10"/></svg>'
+    )
+    path = make_epub(
+        [
+            ("images/a.png", "image/png", image),
+            ("images/b.png", "image/png", image),
+            ("images/fig.svg", "image/svg+xml", svg),
+            (
+                "text/c1.xhtml",
+                "application/xhtml+xml",
+                page('<img src="../images/a.png"/><img src="../images/fig.svg"/>'),
+            ),
+        ]
+    )
+    output = str(tmp_path / "out.epub")
+    stats, log = compress(path, output)
+
+    assert "EPUB/images/b.png" in zipfile.ZipFile(output).namelist()
+    assert stats["problems"] == []
+
+
+def test_unchanged_page_is_written_verbatim(make_epub, tmp_path):
+    # Already minified, so the document stage skips it.
+    content = page(
+        "<p>Hello</p>",
+        head='<link rel="stylesheet" type="text/css" href="../style/main.css"/>',
+    )
+    path = make_epub(
+        [
+            ("style/main.css", "text/css", b"p{margin:0}"),
+            ("text/c1.xhtml", "application/xhtml+xml", content),
+        ]
+    )
+    output = str(tmp_path / "out.epub")
+    stats, log = compress(path, output)
+
+    assert "  - text/c1.xhtml: skipped, already minified." in log
+    assert zipfile.ZipFile(output).read("EPUB/text/c1.xhtml") == content
+    assert stats["problems"] == []
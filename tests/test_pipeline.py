@@ -0,0 +1,127 @@
+# tests/test_pipeline.py
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from core import pipeline
+from core.epub_handler import DEFAULT_OPTIONS
+
+from .conftest import png_bytes
+
+CSS = b"body {\n    color: red;\n}\n\n/* note */\np {\n    margin: 0;\n}\n"
+
+
+def noisy_png(size=(400, 300)):
+    image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(pipeline, "_result_cache", type(pipeline._result_cache)())
+    monkeypatch.setattr(pipeline, "_result_cache_size", 0)
+
+
+def run(jobs, **overrides):
+    results = []
+    options = dict(DEFAULT_OPTIONS, workers=1)
+    options.update(overrides)
+    pipeline.process_items(
+        jobs, options, lambda key, label, content, notes: results.append(key)
+    )
+    return results
+
+
+# --- Options ---
+
+
+def test_wrong_option_type_is_rejected():
+    options = dict(DEFAULT_OPTIONS, image_options={"quality": "high"})
+    with pytest.raises(ValueError, match="'quality' for stage 'images' must be int"):
+        pipeline.resolve_options(pipeline.STAGES["images"], options)
+    with pytest.raises(ValueError):
+        run(
+            [("a", "image/png", png_bytes("red"), "a.png")],
+            image_options={"quality": "high"},
+        )
+
+
+def test_stage_settings_fall_back_to_top_level_and_defaults():
+    options = {"quality": 40, "image_options": {"max_width": 500}}
+    resolved = pipeline.resolve_options(pipeline.STAGES["images"], options)
+    assert resolved["quality"] == 40
+    assert resolved["max_width"] == 500
+    assert resolved["max_height"] is None
+
+
+# --- Scheduler ---
+
+
+def test_results_arrive_in_submission_order_with_workers():
+    jobs = [
+        ("img1", "image/png", noisy_png(), "1.png"),
+        ("css", "text/css", CSS, "a.css"),
+        ("img2", "image/png", noisy_png((200, 100)), "2.png"),
+        ("font", "font/ttf", b"\0\1", "a.ttf"),
+        ("img3", "image/png", png_bytes("blue"), "3.png"),
+    ]
+    assert run(jobs, workers=2) == ["img1", "css", "img2", "font", "img3"]
+
+
+def test_identical_items_are_encoded_once(monkeypatch):
+    encoded = []
+    run_image = pipeline.STAGES["images"]["run"]
+
+    def counting_run(content, options):
+        encoded.append(content)
+        return run_image(content, options)
+
+    monkeypatch.setitem(pipeline.STAGES["images"], "run", counting_run)
+    content = noisy_png()
+    results = {}
+    pipeline.process_items(
+        [
+            ("a", "image/png", content, "a.png"),
+            ("b", "image/png", content, "copy/b.png"),
+            ("c", "image/png", png_bytes("blue"), "c.png"),
+        ],
+        dict(DEFAULT_OPTIONS, workers=1),
+        lambda key, label, new_content, notes: results.update({key: new_content}),
+    )
+    assert len(encoded) == 2
+    assert results["a"] is not None and results["a"] == results["b"]
+
+
+# --- Result Cache ---
+
+
+def test_image_results_are_kept_across_books():
+    run([("a", "image/png", noisy_png(), "a.png")])
+    assert len(pipeline._result_cache) == 1
+    ((new_content, _),) = pipeline._result_cache.values()
+    # The key and bookkeeping count toward the limit, not just the bytes.
+    assert pipeline._result_cache_size > len(new_content)
+
+
+def test_skipped_images_are_not_cached():
+    # Already tiny and within the size limits, so the image stage skips it.
+    run([("a", "image/png", png_bytes("red"), "a.png")])
+    assert len(pipeline._result_cache) == 0
+
+
+def test_stylesheet_results_stay_with_their_book():
+    run([("a", "text/css", CSS, "a.css")])
+    assert len(pipeline._result_cache) == 0
+
+
+def test_cache_evicts_to_its_limit(monkeypatch):
+    monkeypatch.setattr(pipeline, "RESULT_CACHE_LIMIT", 1000)
+    for index in range(10):
+        key = (("images",), bytes([index]), "[{}]")
+        pipeline._cache_put(key, (b"x" * 300, []))
+    assert pipeline._result_cache_size <= 1000
+    assert len(pipeline._result_cache) == 1
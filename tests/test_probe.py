@@ -0,0 +1,109 @@
+# tests/test_probe.py
+import io
+
+import pytest
+from PIL import Image
+
+from core import probe
+
+OPTIONS = {"quality": 75, "max_width": 1200, "max_height": 1600}
+
+
+def encode(image, image_format, **save_options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **save_options)
+    return buffer.getvalue()
+
+
+def gradient(size=(64, 48), mode="RGB"):
+    image = Image.linear_gradient("L").resize(size).convert(mode)
+    if mode == "RGBA":
+        image.putalpha(Image.linear_gradient("L").resize(size))
+    return image
+
+
+# --- Image Probing ---
+
+
+@pytest.mark.parametrize("quality", [5, 10, 30, 50, 75, 90, 95, 100])
+def test_jpeg_quality_estimate_matches_encoder(quality):
+    info = probe.probe_image(encode(gradient(), "JPEG", quality=quality))
+    assert info["format"] == "JPEG"
+    assert (info["width"], info["height"]) == (64, 48)
+    assert info["quality"] == quality
+    assert not info["lossless"]
+
+
+def test_png_reports_bpp_and_alpha():
+    content = encode(gradient(), "PNG")
+    info = probe.probe_image(content)
+    assert info["bpp"] == len(content) * 8 / (64 * 48)
+    assert info["lossless"] and not info["alpha"]
+    assert probe.probe_image(encode(gradient(mode="RGBA"), "PNG"))["alpha"]
+
+
+def test_png_transparency_chunk_counts_as_alpha():
+    palette = Image.new("P", (16, 16), 0)
+    assert not probe.probe_image(encode(palette, "PNG"))["alpha"]
+    assert probe.probe_image(encode(palette, "PNG", transparency=0))["alpha"]
+
+
+def test_webp_alpha_and_losslessness():
+    lossy = probe.probe_image(encode(gradient(mode="RGBA"), "WEBP", quality=50))
+    assert lossy["alpha"] and not lossy["lossless"]
+    assert (lossy["width"], lossy["height"]) == (64, 48)
+
+    lossless = probe.probe_image(encode(gradient(mode="RGBA"), "WEBP", lossless=True))
+    assert lossless["alpha"] and lossless["lossless"]
+
+    opaque = probe.probe_image(encode(gradient(), "WEBP", quality=50))
+    assert not opaque["alpha"] and not opaque["animated"]
+
+
+def test_animated_webp_is_detected_and_skipped():
+    frames = [Image.new("RGB", (32, 32), color) for color in ("red", "blue")]
+    content = encode(frames[0], "WEBP", save_all=True, append_images=frames[1:])
+    info = probe.probe_image(content)
+    assert info["animated"]
+    assert (info["width"], info["height"]) == (32, 32)
+    assert probe.should_skip_image(info, OPTIONS) == "animated WEBP"
+
+
+# Each cut lands inside the header fields the probe needs.
+@pytest.mark.parametrize(
+    "image_format, length", [("JPEG", 100), ("PNG", 20), ("WEBP", 20), ("GIF", 8)]
+)
+def test_truncated_image_gives_none(image_format, length):
+    content = encode(gradient(), image_format)
+    assert probe.probe_image(content[:length]) is None
+
+
+def test_unknown_format_gives_none():
+    assert probe.probe_image(b"not an image at all") is None
+
+
+# --- Skip Rules ---
+
+
+def test_skips_jpeg_already_at_target_quality():
+    info = probe.probe_image(encode(gradient(), "JPEG", quality=60))
+    assert probe.should_skip_image(info, OPTIONS) == "already at quality ~60"
+    assert probe.should_skip_image(info, dict(OPTIONS, quality=40)) is None
+
+
+def test_oversized_image_is_never_skipped():
+    info = probe.probe_image(encode(gradient((300, 200)), "JPEG", quality=60))
+    assert probe.should_skip_image(info, OPTIONS)
+    small_limits = dict(OPTIONS, max_width=100, max_height=100)
+    assert probe.should_skip_image(info, small_limits) is None
+
+
+# --- Text Probing ---
+
+
+def test_is_minified():
+    assert probe.is_minified(b"p{margin:0}h1{color:red}" * 20, "css")
+    assert not probe.is_minified(b"p {\n    margin: 0;\n}\n" * 20, "css")
+    assert not probe.is_minified(b"p{margin:0}/* note */", "css")
+    assert not probe.is_minified(b"<p>a</p><!-- note -->", "html")
+    assert probe.is_minified(b"", "js")
@@ -0,0 +1,160 @@
+# tests/test_server.py
+import http.client
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+
+from core.epub_handler import DEFAULT_OPTIONS
+from core.server import CompressionServer, options_from_query
+
+from .conftest import page, png_bytes
+
+
+@pytest.fixture
+def server():
+    server = CompressionServer(
+        ("127.0.0.1", 0), dict(DEFAULT_OPTIONS), workers=1, queue_limit=0
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def book(make_epub):
+    path = make_epub(
+        [
+            ("images/a.png", "image/png", png_bytes("red", (200, 200))),
+            (
+                "text/c1.xhtml",
+                "application/xhtml+xml",
+                page('<p>Hello</p>\n\n  <img src="../images/a.png"/>'),
+            ),
+        ]
+    )
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def request(server, method, path, body=None, headers=None, chunked=False):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+    try:
+        if chunked:
+            chunks = [body[i : i + 1000] for i in range(0, len(body), 1000)]
+            conn.request(method, path, body=iter(chunks), encode_chunked=True)
+        else:
+            conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def assert_compressed(status, headers, body):
+    assert status == 200, body
+    assert headers["Content-Type"] == "application/epub+zip"
+    assert int(headers["Content-Length"]) == len(body)
+    assert int(headers["X-Final-Size"]) == len(body)
+    assert headers["X-Validation-Problems"] == "0"
+    assert zipfile.ZipFile(io.BytesIO(body)).namelist()[0] == "mimetype"
+
+
+def test_compress_with_content_length(server, book):
+    assert_compressed(*request(server, "POST", "/compress?quality=50", book))
+
+
+def test_compress_chunked_upload(server, book):
+    assert_compressed(*request(server, "POST", "/compress", book, chunked=True))
+
+
+def test_unknown_option_is_400(server, book):
+    status, _, body = request(server, "POST", "/compress?bogus=1", book)
+    assert status == 400
+    assert "bogus" in json.loads(body)["error"]
+
+
+@pytest.mark.parametrize(
+    "query, message",
+    [
+        ("quality=0", "'quality' must be between 1 and 100"),
+        ("quality=101", "'quality' must be between 1 and 100"),
+        ("max_width=0", "'max_width' must be at least 1"),
+        ("max_height=-5", "'max_height' must be at least 1"),
+        ("quality=high", "'quality' must be an integer"),
+    ],
+)
+def test_out_of_range_option_is_400(server, book, query, message):
+    status, _, body = request(server, "POST", f"/compress?{query}", book)
+    assert status == 400
+    assert json.loads(body)["error"] == message
+
+
+def test_options_from_query_accepts_range_limits():
+    options = options_from_query(DEFAULT_OPTIONS, "quality=1&max_width=1&max_height=1")
+    assert options["image_options"]["quality"] == 1
+    options = options_from_query(DEFAULT_OPTIONS, "quality=100")
+    assert options["image_options"]["quality"] == 100
+    assert DEFAULT_OPTIONS["image_options"]["quality"] == 75
+
+
+def test_oversized_upload_is_413(server, book):
+    server.max_upload = len(book) - 1
+    status, _, _ = request(server, "POST", "/compress", book)
+    assert status == 413
+
+
+def test_busy_server_is_429(server, book):
+    server.slots.acquire()
+    try:
+        status, headers, _ = request(server, "POST", "/compress", book)
+    finally:
+        server.slots.release()
+    assert status == 429
+    assert headers["Retry-After"] == "1"
+
+
+def test_health(server):
+    status, _, body = request(server, "GET", "/health")
+    assert status == 200
+    assert json.loads(body) == {"status": "ok", "pool": "ready", "workers": 1}
+
+
+def test_metrics(server, book):
+    request(server, "POST", "/compress", book)
+    request(server, "POST", "/compress?bogus=1", book)
+    status, headers, body = request(server, "GET", "/metrics")
+
+    assert status == 200
+    lines = body.decode("utf-8").splitlines()
+    assert "epub_compressor_jobs_completed_total 1" in lines
+    assert 'epub_compressor_responses_total{code="200"} 1' in lines
+    assert 'epub_compressor_responses_total{code="400"} 1' in lines
+    assert f"epub_compressor_bytes_received_total {len(book)}" in lines
+    assert "epub_compressor_jobs_in_flight 0" in lines
+
+
+def test_worker_crash_restarts_pool(server, book):
+    # Kill the only worker, as a segfault in Pillow would.
+    crashed = server.pool.submit(os._exit, 1)
+    assert crashed.exception() is not None
+
+    status, headers, _ = request(server, "POST", "/compress", book)
+    assert status == 503
+    assert headers["Retry-After"] == "1"
+
+    deadline = time.monotonic() + 30
+    while request(server, "GET", "/health")[0] != 200:
+        assert time.monotonic() < deadline, "pool did not come back"
+        time.sleep(0.1)
+
+    assert_compressed(*request(server, "POST", "/compress", book))
+    _, _, metrics = request(server, "GET", "/metrics")
+    assert b"epub_compressor_pool_restarts_total 1" in metrics
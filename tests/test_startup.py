@@ -0,0 +1,54 @@
+# tests/test_startup.py
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+from core import pipeline
+from core.epub_handler import DEFAULT_OPTIONS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Calls warm_worker in a fresh interpreter, as a pool initializer would, and
+# prints the engines it loaded.
+WARM_WORKER_SCRIPT = """
+import json, sys
+from core import watcher
+import main
+
+watcher.warm_worker(json.loads(sys.argv[1]))
+print(",".join(e for e in main.LAZY_ENGINES if e in sys.modules))
+"""
+
+
+def warm_worker_engines(options):
+    result = subprocess.run(
+        [sys.executable, "-c", WARM_WORKER_SCRIPT, json.dumps(options)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(filter(None, result.stdout.strip().split(",")))
+
+
+def test_entry_points_do_not_load_engines(capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main.benchmark_imports()
+    assert exit_info.value.code == 0, capsys.readouterr().out
+
+
+def test_required_modules_follow_enabled_stages():
+    assert "PIL.Image" in pipeline.required_modules(DEFAULT_OPTIONS)
+    options = dict(DEFAULT_OPTIONS, compress_images=False)
+    assert "PIL.Image" not in pipeline.required_modules(options)
+
+
+def test_warm_worker_skips_pillow_when_images_are_off():
+    assert "PIL" in warm_worker_engines(DEFAULT_OPTIONS)
+    engines = warm_worker_engines(dict(DEFAULT_OPTIONS, compress_images=False))
+    assert "PIL" not in engines
+    assert "cssmin" in engines
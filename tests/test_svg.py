@@ -0,0 +1,54 @@
+# tests/test_svg.py
+from core import svg
+
+SVG_OPEN = '<svg xmlns="http://www.w3.org/2000/svg">'
+
+
+def optimize(markup, precision=3):
+    svg_bytes = (SVG_OPEN + markup + "</svg>").encode("utf-8")
+    optimized = svg.optimize_svg(svg_bytes, {"precision": precision}).decode("utf-8")
+    assert optimized.startswith(SVG_OPEN) and optimized.endswith("</svg>")
+    return optimized[len(SVG_OPEN) : -len("</svg>")]
+
+
+def test_strips_editor_namespaces_and_metadata():
+    svg_bytes = (
+        b'<svg xmlns="http://www.w3.org/2000/svg"'
+        b' xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"'
+        b' xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd">'
+        b"<!-- Created with Inkscape --><metadata><rdf>licence</rdf></metadata>"
+        b'<sodipodi:namedview inkscape:zoom="1"><inkscape:grid/></sodipodi:namedview>'
+        b'<rect inkscape:label="Layer 1" width="10" height="10"/></svg>'
+    )
+    assert svg.optimize_svg(svg_bytes, {}) == (
+        b'<svg xmlns="http://www.w3.org/2000/svg">'
+        b'<rect width="10" height="10"/></svg>'
+    )
+
+
+def test_rounds_numeric_attributes_to_precision():
+    markup = '<path id="p1.23456" d="M 1.23456 2.5 L 3.0001 -0.0001 1e-7"/>'
+    assert optimize(markup, precision=2) == (
+        '<path id="p1.23456" d="M 1.23 2.5 L 3 0 1e-7"/>'
+    )
+
+
+def test_keeps_whitespace_inside_text():
+    markup = '\n  <text x="1"> Hello  <tspan>big </tspan> world </text>\n'
+    assert optimize(markup) == ('<text x="1"> Hello  <tspan>big </tspan> world </text>')
+
+
+def test_unwraps_bare_groups():
+    markup = '<g><g><rect width="1"/></g></g><g/><g id="a"><circle r="1"/></g>'
+    assert optimize(markup) == '<rect width="1"/><g id="a"><circle r="1"/></g>'
+
+
+def test_keeps_groups_that_are_switch_alternatives():
+    markup = (
+        '<switch><g><text systemLanguage="fr">Bonjour</text></g>'
+        "<g><g><text>Hello</text></g></g></switch>"
+    )
+    assert optimize(markup) == (
+        '<switch><g><text systemLanguage="fr">Bonjour</text></g>'
+        "<g><text>Hello</text></g></switch>"
+    )
@@ -0,0 +1,126 @@
+# tests/test_validate.py
+import zipfile
+
+import pytest
+
+from core import validate
+
+from .conftest import page, png_bytes
+
+CONTAINER = (
+    '<?xml version="1.0"?>'
+    '<container version="1.0" '
+    'xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+    '<rootfiles><rootfile full-path="OEBPS/content.opf" '
+    'media-type="application/oebps-package+xml"/></rootfiles></container>'
+)
+
+MANIFEST = {
+    "text/c1.xhtml": "application/xhtml+xml",
+    "images/a.png": "image/png",
+}
+FILES = {
+    "text/c1.xhtml": page('<img src="../images/a.png"/>'),
+    "images/a.png": png_bytes("red"),
+}
+
+
+def opf(manifest):
+    items = "".join(
+        f'<item id="i{index}" href="{href}" media-type="{media_type}"/>'
+        for index, (href, media_type) in enumerate(manifest.items())
+    )
+    return (
+        '<?xml version="1.0"?>'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="3.0">'
+        f"<manifest>{items}</manifest></package>"
+    )
+
+
+@pytest.fixture
+def write_epub(tmp_path):
+    """Writes a minimal EPUB by hand, so each rule can be broken on purpose."""
+
+    def write(manifest=MANIFEST, files=FILES, mimetype_first=True, compress=False):
+        path = tmp_path / "book.epub"
+        with zipfile.ZipFile(path, "w") as zf:
+            mimetype = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            if mimetype_first:
+                zf.writestr("mimetype", validate.MIMETYPE, mimetype)
+            zf.writestr("META-INF/container.xml", CONTAINER)
+            zf.writestr("OEBPS/content.opf", opf(manifest))
+            for file_name, content in files.items():
+                zf.writestr(f"OEBPS/{file_name}", content)
+            if not mimetype_first:
+                zf.writestr("mimetype", validate.MIMETYPE, mimetype)
+        return str(path)
+
+    return write
+
+
+def link_index(files=FILES, manifest=MANIFEST):
+    return {
+        file_name: validate.index_links(manifest[file_name], content)
+        for file_name, content in files.items()
+    }
+
+
+def test_valid_book_has_no_problems(write_epub):
+    assert validate.validate_epub(write_epub(), link_index()) == []
+
+
+def test_mimetype_must_come_first(write_epub):
+    assert validate.validate_epub(write_epub(mimetype_first=False)) == [
+        "'mimetype' is not the first entry in the archive"
+    ]
+
+
+def test_mimetype_must_be_stored(write_epub):
+    assert validate.validate_epub(write_epub(compress=True)) == [
+        "'mimetype' is compressed; it must be stored"
+    ]
+
+
+def test_manifest_item_missing_from_archive(write_epub):
+    manifest = dict(MANIFEST, **{"images/b.png": "image/png"})
+    assert validate.validate_epub(write_epub(manifest=manifest)) == [
+        "Manifest item images/b.png is missing from the archive"
+    ]
+
+
+def test_file_missing_from_manifest(write_epub):
+    files = dict(FILES, **{"images/stray.png": png_bytes("blue")})
+    assert validate.validate_epub(write_epub(files=files)) == [
+        "OEBPS/images/stray.png is in the archive but not in the manifest"
+    ]
+
+
+def test_wrong_declared_media_type(write_epub):
+    manifest = dict(MANIFEST, **{"images/a.png": "image/jpeg"})
+    assert validate.validate_epub(write_epub(manifest=manifest)) == [
+        "images/a.png is declared as image/jpeg but contains image/png"
+    ]
+
+
+def test_dangling_link(write_epub):
+    files = dict(FILES, **{"text/c1.xhtml": page('<img src="../images/gone.png"/>')})
+    problems = validate.validate_epub(write_epub(files=files), link_index(files))
+    assert problems == ["text/c1.xhtml links to missing file ../images/gone.png"]
+
+
+def test_index_links_finds_attributes_and_css_urls():
+    markup = page(
+        "<p style=\"background: url('../images/bg.png')\">"
+        '<a href="c2.xhtml#note">n</a></p>',
+        head="<style>p { background: url(../images/p.png) }</style>"
+        '<link href="../styles/main.css" rel="stylesheet"/>',
+    )
+    assert sorted(validate.index_links("application/xhtml+xml", markup)) == [
+        "../images/bg.png",
+        "../images/p.png",
+        "../styles/main.css",
+        "c2.xhtml#note",
+    ]
+    css = b"@import url('a.css'); p { background: url( \"../images/p.png\" ) }"
+    assert validate.index_links("text/css", css) == ["a.css", "../images/p.png"]
+    assert validate.index_links("image/png", b"url(x.png)") == []
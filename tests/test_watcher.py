@@ -0,0 +1,159 @@
+# tests/test_watcher.py
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+from core import watcher
+
+from .conftest import page
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs the service with a run_job that kills its worker process, as a
+# segfault or OOM kill in Pillow would: the first time for books named
+# crash-once*, every time for crash-always*. Books named slow* take a second.
+SERVICE_SCRIPT = """
+import os, sys, time
+from core import epub_handler, watcher
+
+watcher.RETRY_BASE_DELAY = 0
+original_run_job = watcher.run_job
+
+
+def crashing_run_job(input_path, output_path, options):
+    name = os.path.basename(input_path)
+    marker = input_path + ".crashed"
+    if name.startswith("crash-always") or (
+        name.startswith("crash-once") and not os.path.exists(marker)
+    ):
+        open(marker, "w").close()
+        os._exit(1)
+    if name.startswith("slow"):
+        time.sleep(1)
+    return original_run_job(input_path, output_path, options)
+
+
+watcher.run_job = crashing_run_job
+watcher.run_watch_service(
+    [sys.argv[1]],
+    sys.argv[2],
+    dict(epub_handler.DEFAULT_OPTIONS),
+    queue_path=sys.argv[3],
+    workers=int(sys.argv[4]),
+    poll_interval=0.1,
+    log_callback=lambda message: print(message, flush=True),
+)
+"""
+
+
+def job_statuses(queue_path):
+    with sqlite3.connect(queue_path) as conn:
+        try:
+            return [row[0] for row in conn.execute("SELECT status FROM jobs")]
+        except sqlite3.OperationalError:
+            return []  # The service has not created the queue yet
+
+
+def job_attempts(queue_path):
+    with sqlite3.connect(queue_path) as conn:
+        rows = conn.execute("SELECT input_path, status, attempts FROM jobs")
+        return {os.path.basename(path): (status, n) for path, status, n in rows}
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def start_service(make_epub, tmp_path, names=("crash-once",), workers=1):
+    """Drops books into a watched folder and starts the service on them."""
+    inbox, outbox = tmp_path / "in", tmp_path / "out"
+    inbox.mkdir()
+    for name in names:
+        book = make_epub(
+            [("text/c1.xhtml", "application/xhtml+xml", page("<p>Hello</p>"))]
+        )
+        os.replace(book, inbox / f"{name}.epub")
+    queue_path = str(tmp_path / "queue.sqlite3")
+
+    service = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            SERVICE_SCRIPT,
+            str(inbox),
+            str(outbox),
+            queue_path,
+            str(workers),
+        ],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        start_new_session=True,
+    )
+    return service, outbox / f"{names[0]}_compressed.epub", queue_path
+
+
+def stop_service(service, signum, group):
+    try:
+        if group:
+            os.killpg(service.pid, signum)
+        else:
+            service.send_signal(signum)
+        log, _ = service.communicate(timeout=30)
+    finally:
+        if service.poll() is None:
+            os.killpg(service.pid, signal.SIGKILL)
+    return log
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs process groups")
+def test_service_survives_worker_crash(make_epub, tmp_path):
+    service, output_path, queue_path = start_service(make_epub, tmp_path)
+    compressed = wait_for(output_path.exists)
+    alive = service.poll() is None
+    log = stop_service(service, signal.SIGTERM, group=False)
+
+    assert compressed, log
+    assert alive, log
+    assert "restarting the worker pool" in log
+    assert job_statuses(queue_path) == ["done"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs process groups")
+def test_ctrl_c_stops_the_service_cleanly(make_epub, tmp_path):
+    service, output_path, queue_path = start_service(make_epub, tmp_path)
+    compressed = wait_for(output_path.exists)
+    # Ctrl+C signals the whole process group, workers included.
+    log = stop_service(service, signal.SIGINT, group=True)
+
+    assert compressed, log
+    assert service.returncode == 0, log
+    assert "Traceback" not in log
+    assert job_statuses(queue_path) == ["done"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs process groups")
+def test_crash_is_charged_only_to_the_crashing_book(make_epub, tmp_path):
+    service, output_path, queue_path = start_service(
+        make_epub, tmp_path, names=("slow", "crash-always"), workers=2
+    )
+    given_up = wait_for(lambda: sorted(job_statuses(queue_path)) == ["done", "failed"])
+    log = stop_service(service, signal.SIGTERM, group=False)
+
+    assert given_up, log
+    assert output_path.exists(), log
+    assert job_attempts(queue_path) == {
+        "slow.epub": ("done", 1),
+        "crash-always.epub": ("failed", watcher.MAX_ATTEMPTS),
+    }
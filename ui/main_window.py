@@ -107,10 +107,22 @@ class MainWindow(QMainWindow):
             self.update_estimates
         )  # Connect signal
 
+        self.cb_skip_optimized = QCheckBox("Skip Already-Optimized Files")
+        self.cb_skip_optimized.setChecked(True)
+
+        self.cb_dedupe_assets = QCheckBox("Merge Duplicate Images and Fonts")
+        self.cb_dedupe_assets.setChecked(True)
+
+        self.cb_validate_output = QCheckBox("Validate Output")
+        self.cb_validate_output.setChecked(True)
+
         settings_layout.addRow(self.cb_compress_images)
         settings_layout.addRow(self.cb_minify_html)
         settings_layout.addRow(self.cb_minify_css)
         settings_layout.addRow(self.cb_strip_fonts)
+        settings_layout.addRow(self.cb_skip_optimized)
+        settings_layout.addRow(self.cb_dedupe_assets)
+        settings_layout.addRow(self.cb_validate_output)
 
         self.image_quality_slider = QSlider(Qt.Orientation.Horizontal)
         self.image_quality_slider.setRange(10, 95)
@@ -249,6 +261,9 @@ class MainWindow(QMainWindow):
             "minify_html": self.cb_minify_html.isChecked(),
             "minify_css": self.cb_minify_css.isChecked(),
             "strip_fonts": self.cb_strip_fonts.isChecked(),
+            "skip_optimized": self.cb_skip_optimized.isChecked(),
+            "dedupe_assets": self.cb_dedupe_assets.isChecked(),
+            "validate_output": self.cb_validate_output.isChecked(),
             "image_options": {
                 "quality": self.image_quality_slider.value(),
                 "max_width": 1200,